@@ -0,0 +1,363 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from functools import lru_cache
+from urllib.parse import parse_qs, urlsplit
+
+from yt_dlp.extractor import gen_extractor_classes
+
+
+# --- Canonical Media ID ---
+_extractor_classes = None
+
+
+def _get_extractor_classes():
+    global _extractor_classes
+    if _extractor_classes is None:
+        _extractor_classes = gen_extractor_classes()
+    return _extractor_classes
+
+
+@lru_cache(maxsize=4096)
+def canonical_media_id(url):
+    """Build a cache key that is shared by every URL variant of the same media.
+
+    The key is '<extractor_key>:<video_id>' when a specific yt-dlp extractor
+    recognises the URL (so youtu.be/X, youtube.com/watch?v=X&t=3 and their
+    http/https variants all map to 'Youtube:X'). URLs only matched by the
+    generic extractor fall back to a scheme-less, lowercased host + path + query.
+
+    Args:
+        url: The URL submitted by the client
+
+    Returns:
+        str: Canonical media ID
+    """
+    for ie in _get_extractor_classes():
+        if ie.ie_key() == 'Generic' or not ie.suitable(url):
+            continue
+        video_id = ie.get_temp_id(url)
+        if video_id:
+            return f'{ie.ie_key()}:{video_id}'
+        break
+
+    parts = urlsplit(url.strip())
+    normalized = f'{parts.netloc.lower()}{parts.path}'
+    if parts.query:
+        normalized += f'?{parts.query}'
+    return f'url:{normalized}'
+
+
+def media_id_from_info(info):
+    """Canonical media ID derived from an extracted yt-dlp info dict."""
+    if info.get('extractor_key') and info.get('id'):
+        return f"{info['extractor_key']}:{info['id']}"
+    return None
+
+
+def signed_url_expiry(info):
+    """Return the earliest expiry timestamp of the signed format URLs in info.
+
+    YouTube signs googlevideo URLs with an 'expire' query parameter (unix time),
+    Facebook/Instagram CDNs use 'oe' (hex unix time). Returns None when no
+    format URL carries an expiry.
+    """
+    earliest = None
+    for f in info.get('formats') or []:
+        format_url = f.get('url')
+        if not format_url:
+            continue
+        query = parse_qs(urlsplit(format_url).query)
+        expires_at = None
+        try:
+            if 'expire' in query:
+                expires_at = int(query['expire'][0])
+            elif 'Expires' in query:
+                expires_at = int(query['Expires'][0])
+            elif 'oe' in query:
+                expires_at = int(query['oe'][0], 16)
+        except ValueError:
+            continue
+        if expires_at and (earliest is None or expires_at < earliest):
+            earliest = expires_at
+    return earliest
+
+
+# --- Two-tier Cache ---
+class AnalysisCache:
+    """In-memory LRU cache of analysis results with an optional on-disk tier.
+
+    Each entry is fresh until 'fresh_until' and may then be served stale for
+    another 'stale_ttl' seconds while a single background refresh runs
+    (stale-while-revalidate). Entries are written through to disk_dir, when
+    configured, so the cache survives restarts.
+    """
+
+    def __init__(self, max_entries=512, ttl=1800, stale_ttl=300, disk_dir=None, expiry_margin=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.disk_dir = disk_dir
+        self.expiry_margin = expiry_margin
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._stats = collections.Counter()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _fresh_until(self, now, expires_at):
+        """Clamp the TTL so an entry never outlives its signed format URLs."""
+        fresh_until = now + self.ttl
+        if expires_at:
+            fresh_until = min(fresh_until, expires_at - self.expiry_margin)
+        return max(fresh_until, now)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Discarding unreadable analysis cache file {path}: {e}")
+            self._remove_disk(key)
+            return None
+        if entry.get('key') != key:
+            return None
+        return entry
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(entry, key=key), f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Could not write analysis cache file {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _remove_disk(self, key):
+        if not self.disk_dir:
+            return
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def _store_memory(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def get(self, key):
+        """Look up key in memory, then on disk.
+
+        Returns:
+            tuple: (value, state) where state is 'fresh', 'stale' or None on miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                tier = 'memory'
+        if entry is None:
+            entry = self._read_disk(key)
+            tier = 'disk'
+            if entry is not None:
+                with self._lock:
+                    self._store_memory(key, entry)
+
+        if entry is None or now >= entry['fresh_until'] + self.stale_ttl:
+            if entry is not None:
+                self.delete(key)
+            with self._lock:
+                self._stats['misses'] += 1
+            return None, None
+
+        state = 'fresh' if now < entry['fresh_until'] else 'stale'
+        with self._lock:
+            self._stats[f'{tier}_hits'] += 1
+            if state == 'stale':
+                self._stats['stale_hits'] += 1
+        return entry['value'], state
+
+    def set(self, key, value, expires_at=None):
+        """Store value under key, honouring the signed-URL expiry if given."""
+        now = time.time()
+        entry = {'value': value, 'fresh_until': self._fresh_until(now, expires_at), 'stored_at': now}
+        with self._lock:
+            self._store_memory(key, entry)
+        self._write_disk(key, entry)
+
+    def version(self, key, value):
+        """When the entry under key holding value was stored, or None when
+        key now holds another value (or nothing) in memory."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['value'] is not value:
+                return None
+            return entry.get('stored_at')
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        self._remove_disk(key)
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() on a miss.
+
+        loader must return (value, expires_at) and may raise; failures are not
+        cached. A stale hit is served immediately and refreshed in the background.
+        """
+        value, state = self.get(key)
+        if state == 'fresh':
+            return value
+        if state == 'stale':
+            self._refresh_in_background(key, loader)
+            return value
+        value, expires_at = loader()
+        self.set(key, value, expires_at)
+        return value
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                value, expires_at = loader()
+                self.set(key, value, expires_at)
+                with self._lock:
+                    self._stats['refreshes'] += 1
+            except Exception as e:
+                logging.warning(f"Background refresh failed for {key}: {e}")
+                with self._lock:
+                    self._stats['refresh_errors'] += 1
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        thread = threading.Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+
+    def prune_disk(self):
+        """Remove expired entries from the disk tier."""
+        if not self.disk_dir:
+            return 0
+        removed = 0
+        cutoff = time.time() - self.stale_ttl
+        for entry_name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, entry_name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    expired = json.load(f).get('fresh_until', 0) < cutoff
+            except (OSError, ValueError):
+                expired = True
+            if expired:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        hits = stats.get('memory_hits', 0) + stats.get('disk_hits', 0)
+        lookups = hits + stats.get('misses', 0)
+        stats['hits'] = hits
+        stats['hit_ratio'] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+
+# --- Analysis Tokens ---
+class AnalysisTokens:
+    """Raw yt-dlp info dicts of recent analyses, handed out as short-lived tokens.
+
+    A download that presents a token starts from the stored info dict
+    instead of extracting the media again. Info dicts are kept as JSON (each
+    use gets a fresh copy to process) in an LRU of max_entries, keyed by
+    canonical media ID; a token lives for ttl seconds and resolves only
+    while the stored format URLs are valid for at least expiry_margin more
+    seconds.
+    """
+
+    def __init__(self, max_entries=128, ttl=900, expiry_margin=120):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.expiry_margin = expiry_margin
+        self._infos = collections.OrderedDict()
+        self._tokens = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    def put(self, media_id, info_json, cookies=(), expires_at=None):
+        """Store the sanitized info dict (as JSON) extracted for media_id."""
+        entry = {'info': info_json, 'cookies': list(cookies), 'expires_at': expires_at}
+        with self._lock:
+            self._infos[media_id] = entry
+            self._infos.move_to_end(media_id)
+            while len(self._infos) > self.max_entries:
+                self._infos.popitem(last=False)
+
+    def issue(self, media_id):
+        """Return a new token for the info stored under media_id, or None if there is none."""
+        now = time.time()
+        with self._lock:
+            entry = self._infos.get(media_id)
+            if entry is None or not self._usable(entry, now):
+                return None
+            # Tokens are issued in expiry order, so expired ones are at the front
+            while self._tokens and next(iter(self._tokens.values()))[1] < now:
+                self._tokens.popitem(last=False)
+            token = secrets.token_urlsafe(16)
+            self._tokens[token] = (media_id, now + self.ttl)
+            self._stats['issued'] += 1
+            return token
+
+    def resolve(self, token, media_id):
+        """Return (info JSON, cookies) for a valid token issued for media_id,
+        or None if the media must be extracted again."""
+        now = time.time()
+        with self._lock:
+            token_media_id, token_expires = self._tokens.get(token, (None, 0))
+            valid = token_media_id == media_id and token_expires >= now
+            entry = self._infos.get(media_id) if valid else None
+            if entry is None or not self._usable(entry, now):
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            return entry['info'], entry['cookies']
+
+    def _usable(self, entry, now):
+        return entry['expires_at'] is None or entry['expires_at'] - self.expiry_margin > now
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, infos=len(self._infos), tokens=len(self._tokens))
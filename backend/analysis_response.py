@@ -0,0 +1,182 @@
+import collections
+import gzip
+import hashlib
+import json
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional: responses fall back to gzip
+    brotli = None
+
+from format_planner import codec_name
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 1024
+# Moderate levels: the body is compressed per response (it carries a fresh analysis token)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def encodings():
+    """Content codings the server can produce, preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(body, encoding):
+    """body (bytes) in the given content coding ('br', 'gzip' or None)."""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def video_rung(f):
+    """Quality rung of a video format (a yt-dlp format or its summary): height, fps, codec."""
+    return f.get('height'), round(f['fps']) if f.get('fps') else None, codec_name(f.get('vcodec'))
+
+
+def audio_rung(f):
+    """Quality rung of an audio format: its codec."""
+    return codec_name(f.get('acodec'))
+
+
+def first_per_rung(formats, rung):
+    """The first format of each rung, in list order."""
+    seen = set()
+    kept = []
+    for f in formats:
+        if rung(f) not in seen:
+            seen.add(rung(f))
+            kept.append(f)
+    return kept
+
+
+def without_nulls(f):
+    return {key: value for key, value in f.items() if value is not None}
+
+
+def public_media_info(media_info):
+    """media_info as sent to clients, without the keys kept for the server (see extract_media_info)."""
+    return {key: value for key, value in media_info.items() if not key.startswith('_')}
+
+
+def compact_media_info(media_info):
+    """The quality ladder of an analysis, without null keys.
+
+    Video formats keep one entry per height/fps/codec rung and audio formats
+    one per codec, each the entry the full response lists first for that
+    rung (the highest bitrate, for audio), so that both modes offer the
+    same format for a rung. The ladder is picked from the raw yt-dlp formats
+    at extraction time and stored under '_compact'; analyses stored without
+    it are filtered here.
+    """
+    compact = public_media_info(media_info)
+    ladder = media_info.get('_compact')
+    if ladder is None:
+        videos = first_per_rung(media_info.get('video_formats') or [], video_rung)
+        audios = first_per_rung(media_info.get('audio_formats') or [], audio_rung)
+        ladder = {'video_formats': [without_nulls(f) for f in videos],
+                  'audio_formats': [without_nulls(f) for f in audios]}
+    compact.update(ladder)
+    return compact
+
+
+def parse_fields(value):
+    """Parse a field selector: 'title,duration,video_formats(height,fps)'.
+
+    Returns:
+        dict or None: Top-level field -> tuple of format keys (None for the
+        whole value); None when value is empty
+
+    Raises:
+        ValueError: Unbalanced parentheses
+    """
+    if not value:
+        return None
+    fields = {}
+    name, sub, depth = '', '', 0
+    for char in value + ',':
+        if char == '(':
+            depth += 1
+            if depth > 1:
+                raise ValueError(f'nested selector in {value!r}')
+        elif char == ')':
+            depth -= 1
+            if depth < 0:
+                raise ValueError(f'unbalanced parentheses in {value!r}')
+        elif char == ',' and depth == 0:
+            name = name.strip()
+            if name:
+                keys = tuple(dict.fromkeys(key.strip() for key in sub.split(',') if key.strip()))
+                fields[name] = keys or None
+            name, sub = '', ''
+        elif depth:
+            sub += char
+        else:
+            name += char
+    if depth:
+        raise ValueError(f'unbalanced parentheses in {value!r}')
+    return fields
+
+
+def select_fields(media_info, fields):
+    """The fields of media_info named by a parse_fields() selector (unknown fields are left out)."""
+    selected = {}
+    for name, keys in fields.items():
+        if name not in media_info:
+            continue
+        value = media_info[name]
+        if keys is not None and isinstance(value, list):
+            value = [{key: f[key] for key in keys if key in f} for f in value]
+        selected[name] = value
+    return selected
+
+
+def append_field(body, name, value):
+    """Add a field to a serialized JSON object without decoding it."""
+    field = json.dumps({name: value}, separators=(',', ':')).encode('utf-8')[1:]
+    return body[:-1] + (b',' if len(body) > 2 else b'') + field
+
+
+def analysis_etag(media_id, version, variant):
+    """Entity tag of an analyze response: the canonical media ID, the stored
+    analysis it was built from, and the response variant (compact, fields)."""
+    key = json.dumps([media_id, version, variant], sort_keys=True)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+
+class ResponseBodies:
+    """LRU of serialized analyze responses (without the analysis token), by entity tag.
+
+    Repeat views of a media by other clients skip filtering and JSON
+    encoding; an entity tag changes with the stored analysis, so entries
+    never go stale, they only age out.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._bodies = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    def get_or_build(self, etag, build):
+        """The body stored under etag, or build() (bytes) stored under it."""
+        with self._lock:
+            body = self._bodies.get(etag)
+            if body is not None:
+                self._bodies.move_to_end(etag)
+                self._stats['hits'] += 1
+                return body
+            self._stats['misses'] += 1
+        body = build()
+        with self._lock:
+            self._bodies[etag] = body
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+        return body
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._bodies))
@@ -0,0 +1,354 @@
+import collections
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ArtifactStore:
+    """Index of the finished downloads kept in the download directory.
+
+    Each artifact records its owner task, size, creation and last-served time
+    and the responses currently sending it (refs). The index is ordered by
+    last use, so enforcing the byte quota evicts the least recently served
+    artifacts that nobody is downloading. Changes are appended to a
+    JSON-lines manifest in the directory, which is replayed (and compacted) on
+    startup instead of walking the directory. Artifacts older than max_age
+    seconds are deleted even if they were never fetched.
+
+    Several server processes may share the directory, and then share one
+    index and one quota: every change (refs and scheduled deletions included)
+    is journaled under an exclusive flock on a lock file next to the
+    manifest, and each process reads the records appended by the others
+    before it changes, evicts or deletes anything. Refs are kept per process,
+    so those of a process that died are ignored. Removals by another process
+    are reported to on_evict like this process's own evictions.
+    """
+
+    MANIFEST_NAME = 'manifest.jsonl'
+
+    def __init__(self, root, quota_bytes, delete_delay=60, max_age=86400, on_evict=None):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.delete_delay = delete_delay
+        self.max_age = max_age
+        self.on_evict = on_evict
+        self.manifest_path = os.path.join(root, self.MANIFEST_NAME)
+        # The manifest itself is replaced by compaction, so the lock lives in its own file
+        self.lock_path = self.manifest_path + '.lock'
+        self._pid = str(os.getpid())
+        self._lock = threading.Lock()
+        self._artifacts = collections.OrderedDict()
+        self._used_bytes = 0
+        self._journal_lines = 0
+        # Position in the manifest up to which records have been applied
+        self._manifest_id = None
+        self._offset = 0
+        self._stats = collections.Counter()
+
+    # --- Manifest ---
+    @contextlib.contextmanager
+    def _manifest_lock(self):
+        """Exclusive lock on the manifest across processes."""
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def _synced(self):
+        """Hold both locks with the index caught up with the manifest.
+
+        Yields a list that collects (path, owner) of artifacts other processes
+        removed, reported to on_evict once the locks are released.
+        """
+        removed_elsewhere = []
+        with self._lock:
+            with self._manifest_lock():
+                self._catch_up(removed_elsewhere)
+                yield removed_elsewhere
+        for path, owner in removed_elsewhere:
+            self._report_eviction(path, owner)
+
+    def _catch_up(self, removed_elsewhere=None):
+        """Apply the records appended since the last call. Caller holds both locks."""
+        try:
+            f = open(self.manifest_path, 'rb')
+        except FileNotFoundError:
+            if self._manifest_id is not None:
+                self._reset(None)
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            if (st.st_dev, st.st_ino) != self._manifest_id or st.st_size < self._offset:
+                # First read, or compacted by another process: replay from the start
+                self._reset((st.st_dev, st.st_ino))
+                removed_elsewhere = None  # nothing is reported for a full replay
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # torn by a crash (appends hold the lock); the next append terminates it
+                self._offset += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._journal_lines += 1
+                self._apply(record, removed_elsewhere)
+
+    def _reset(self, manifest_id):
+        self._artifacts = collections.OrderedDict()
+        self._used_bytes = 0
+        self._journal_lines = 0
+        self._offset = 0
+        self._manifest_id = manifest_id
+
+    def _apply(self, record, removed_elsewhere=None):
+        """Apply one manifest record to the index. Caller holds the lock."""
+        path = record.get('path')
+        op = record.get('op')
+        if op == 'add':
+            previous = self._artifacts.pop(path, None)
+            if previous:
+                self._used_bytes -= previous['size']
+            artifact = dict(record['artifact'])
+            artifact.setdefault('refs', {})
+            artifact.setdefault('delete_at', None)
+            self._artifacts[path] = artifact
+            self._used_bytes += artifact['size']
+            return
+        artifact = self._artifacts.get(path)
+        if artifact is None:
+            return
+        if op == 'acquire':
+            refs = artifact['refs']
+            refs[record['pid']] = refs.get(record['pid'], 0) + 1
+        elif op == 'release':
+            refs = artifact['refs']
+            count = refs.get(record['pid'], 0) - 1
+            if count > 0:
+                refs[record['pid']] = count
+            else:
+                refs.pop(record['pid'], None)
+            artifact['last_served'] = record['time']
+            self._artifacts.move_to_end(path)
+        elif op == 'served':
+            artifact['last_served'] = record['time']
+            self._artifacts.move_to_end(path)
+        elif op == 'delete_at':
+            artifact['delete_at'] = record['time']
+        elif op == 'remove':
+            del self._artifacts[path]
+            self._used_bytes -= artifact['size']
+            if removed_elsewhere is not None and record.get('pid') != self._pid:
+                removed_elsewhere.append((path, artifact['owner']))
+
+    def _append(self, record):
+        """Journal a change and apply it. Caller holds both locks (see _synced)."""
+        record = dict(record, pid=self._pid)
+        data = (json.dumps(record) + '\n').encode('utf-8')
+        try:
+            with open(self.manifest_path, 'ab') as f:
+                end = f.seek(0, os.SEEK_END)
+                if end != self._offset:
+                    data = b'\n' + data  # end a torn record left by a crash
+                f.write(data)
+                st = os.fstat(f.fileno())
+        except OSError as e:
+            logging.error(f"Could not write artifact manifest {self.manifest_path}: {e}")
+            return
+        self._manifest_id = (st.st_dev, st.st_ino)
+        self._offset = end + len(data)
+        self._journal_lines += 1
+        self._apply(record)
+
+    def _compact(self):
+        """Rewrite the manifest as one 'add' record per artifact. Caller holds both locks.
+
+        The index has just been caught up with the manifest, so artifacts,
+        refs and scheduled deletions of every process are kept; refs of
+        processes that are gone are dropped.
+        """
+        tmp_path = f'{self.manifest_path}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for path, artifact in list(self._artifacts.items()):
+                    if not os.path.exists(path):
+                        self._forget(path, journal=False)
+                        continue
+                    artifact['refs'] = {pid: count for pid, count in artifact['refs'].items()
+                                        if _process_alive(int(pid))}
+                    f.write(json.dumps({'op': 'add', 'path': path, 'artifact': artifact}) + '\n')
+                f.flush()
+                st = os.fstat(f.fileno())
+            os.replace(tmp_path, self.manifest_path)
+            self._manifest_id = (st.st_dev, st.st_ino)
+            self._offset = st.st_size
+            self._journal_lines = len(self._artifacts)
+        except OSError as e:
+            logging.error(f"Could not compact artifact manifest {self.manifest_path}: {e}")
+
+    def load(self):
+        """Rebuild the index from the manifest and rewrite it compacted."""
+        with self._synced():
+            # Files removed behind our back (e.g. by hand) are dropped by the compaction
+            self._compact()
+            count, used_bytes = len(self._artifacts), self._used_bytes
+        logging.info(f"Artifact store: {count} files ({used_bytes} bytes) indexed from {self.manifest_path}")
+        self._enforce_quota()
+
+    # --- Lifecycle ---
+    def add(self, path, owner, size=None):
+        """Index a finished file (or task directory) and evict older ones if the quota is exceeded.
+
+        Args:
+            path: File or directory to index
+            owner: Task that produced it
+            size: Bytes it occupies; looked up when path is a file and size is not given
+        """
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError as e:
+                logging.error(f"Cannot index missing artifact {path}: {e}")
+                return
+        artifact = {'owner': owner, 'size': size, 'created': time.time(), 'last_served': None}
+        with self._synced():
+            self._append({'op': 'add', 'path': path, 'artifact': artifact})
+        self._enforce_quota(keep=path)
+
+    def acquire(self, path):
+        """A response starts sending path; it is not evicted or deleted (by any process) until released.
+
+        Returns:
+            bool: False when path is not indexed (e.g. it has just been evicted)
+        """
+        with self._synced():
+            if path not in self._artifacts:
+                return False
+            self._append({'op': 'acquire', 'path': path})
+            return True
+
+    def release(self, path):
+        """A response sending path has closed."""
+        now = time.time()
+        with self._synced():
+            artifact = self._artifacts.get(path)
+            if artifact is None:
+                return
+            self._append({'op': 'release', 'path': path, 'time': now})
+            self._stats['served'] += 1
+            due = not self._referenced(artifact) and artifact['delete_at'] is not None and artifact['delete_at'] <= now
+        if due:
+            self._delete(path)
+
+    def delete_soon(self, path, delay=None):
+        """Schedule path for deletion (e.g. after its final fetch); sweep() deletes it."""
+        with self._synced():
+            if path in self._artifacts:
+                delete_at = time.time() + (self.delete_delay if delay is None else delay)
+                self._append({'op': 'delete_at', 'path': path, 'time': delete_at})
+                return
+        # Not indexed (e.g. never finished): delete right away
+        self._remove_file(path)
+
+    def sweep(self):
+        """Delete artifacts that are due or too old and compact the manifest."""
+        now = time.time()
+        with self._synced():
+            due = [path for path, artifact in self._artifacts.items()
+                   if not self._referenced(artifact)
+                   and (artifact['created'] < now - self.max_age
+                        or (artifact['delete_at'] is not None and artifact['delete_at'] <= now))]
+        for path in due:
+            self._delete(path)
+        with self._synced():
+            if self._journal_lines > 2 * len(self._artifacts) + 100:
+                self._compact()
+
+    def _referenced(self, artifact):
+        """Whether a live process is sending the artifact. Caller holds the lock."""
+        return any(count > 0 and _process_alive(int(pid)) for pid, count in artifact['refs'].items())
+
+    def _enforce_quota(self, keep=None):
+        """Evict artifacts until the quota holds; keep (the file just added) is never evicted."""
+        evicted = []
+        with self._synced():
+            if self._used_bytes > self.quota_bytes:
+                # Least recently served first; files being sent are skipped
+                for path, artifact in list(self._artifacts.items()):
+                    if self._used_bytes <= self.quota_bytes:
+                        break
+                    if self._referenced(artifact) or path == keep:
+                        continue
+                    self._forget(path)
+                    evicted.append((path, artifact))
+                self._stats['evictions'] += len(evicted)
+                self._stats['evicted_bytes'] += sum(artifact['size'] for _, artifact in evicted)
+        for path, artifact in evicted:
+            logging.info(f"Evicting {path} ({artifact['size']} bytes) to stay within the artifact quota")
+            self._remove_file(path)
+            self._report_eviction(path, artifact['owner'])
+
+    def _report_eviction(self, path, owner):
+        if self.on_evict:
+            try:
+                self.on_evict(path, owner)
+            except Exception as e:
+                logging.error(f"Eviction callback failed for {path}: {e}")
+
+    def _forget(self, path, journal=True):
+        """Drop path from the index. Caller holds both locks."""
+        if journal:
+            self._append({'op': 'remove', 'path': path})
+        else:
+            self._apply({'op': 'remove', 'path': path, 'pid': self._pid})
+
+    def _delete(self, path):
+        """Delete a due artifact unless a response (of any process) started sending it meanwhile."""
+        with self._synced():
+            artifact = self._artifacts.get(path)
+            if artifact is None or self._referenced(artifact):
+                return
+            self._forget(path)
+            self._stats['deleted'] += 1
+        self._remove_file(path)
+
+    def _remove_file(self, path):
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            logging.info(f"Removed download artifact: {path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error(f"Error removing download artifact {path}: {e}")
+
+    def __contains__(self, path):
+        with self._synced():
+            return path in self._artifacts
+
+    def stats(self):
+        with self._synced():
+            return dict(self._stats, files=len(self._artifacts), used_bytes=self._used_bytes,
+                        quota_bytes=self.quota_bytes)
@@ -0,0 +1,154 @@
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+
+def host_of(url):
+    """Host used for the per-host concurrency cap ('www.' and 'm.' prefixes ignored)."""
+    host = urlsplit(url.strip()).netloc.lower().rsplit('@', 1)[-1]
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+
+class BatchAnalyzer:
+    """Analyzes the URLs of a batch request concurrently and reports each result when it is ready.
+
+    Every batch shares one thread pool of `workers` extraction threads. A
+    single batch keeps at most `parallelism` analyses in flight, no more than
+    `per_host` of them for the same host, so a 50-link paste neither hogs the
+    pool nor hammers one site. Source URLs are probed first: a playlist
+    yields an iterator of entry URLs, which is only advanced when the batch
+    has room for more work, so long playlists are expanded lazily. At most
+    `max_items` media are analyzed per batch.
+    """
+
+    def __init__(self, workers=8, parallelism=4, per_host=2, max_items=100):
+        self.workers = workers
+        self.parallelism = parallelism
+        self.per_host = per_host
+        self.max_items = max_items
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-analyze')
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+        self._active = 0
+
+    def run(self, sources, probe, analyze, describe_error=str, parallelism=None):
+        """Analyze sources, yielding one event dict per result in completion order.
+
+        Args:
+            sources: URLs submitted by the client (single media or playlists)
+            probe: probe(url) returns ('media', media_info) for a single media,
+                or ('playlist', playlist_info, entry_urls) for a playlist whose
+                entry_urls iterator is expanded lazily (closed when the batch ends)
+            analyze: analyze(url) returns the media_info of a playlist entry
+            describe_error: Turns an analysis exception into the client message
+            parallelism: Requested concurrency, capped at self.parallelism
+
+        Yields:
+            dict: {'type': 'media'|'error'|'playlist', 'index', 'url', ...} events,
+            then one {'type': 'done', ...} summary
+        """
+        limit = max(1, min(parallelism or self.parallelism, self.parallelism))
+        started = time.monotonic()
+        # (index, url, is_source, playlist_index) waiting to be submitted
+        pending = collections.deque()
+        playlists = collections.deque()  # (playlist_index, entry URL iterator)
+        running = {}
+        host_load = collections.Counter()
+        counts = collections.Counter()
+        next_index = 0
+        truncated = False
+
+        for url in sources:
+            if next_index >= self.max_items:
+                truncated = True
+                break
+            pending.append((next_index, url, True, None))
+            next_index += 1
+
+        def pull_entries():
+            """Top up pending from the playlists until it can fill the free slots."""
+            nonlocal next_index, truncated
+            while playlists and len(pending) < limit:
+                if next_index >= self.max_items:
+                    truncated = True
+                    return
+                playlist_index, entries = playlists[0]
+                entry_url = next(entries, None)
+                if entry_url is None:
+                    playlists.popleft()
+                    continue
+                pending.append((next_index, entry_url, False, playlist_index))
+                next_index += 1
+
+        def take_job():
+            for job in pending:
+                if host_load[host_of(job[1])] < self.per_host:
+                    pending.remove(job)
+                    return job
+            return None
+
+        with self._lock:
+            self._active += 1
+            self._stats['batches'] += 1
+        try:
+            while pending or playlists or running:
+                pull_entries()
+                while len(running) < limit:
+                    job = take_job()
+                    if job is None:
+                        break
+                    host_load[host_of(job[1])] += 1
+                    running[self._executor.submit(probe if job[2] else analyze, job[1])] = job
+                if not running:
+                    # Everything left is capped by its host and nothing runs to free a slot;
+                    # cannot happen with per_host >= 1, but never spin
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, url, is_source, playlist_index = running.pop(future)
+                    host_load[host_of(url)] -= 1
+                    event = {'index': index, 'url': url}
+                    if playlist_index is not None:
+                        event['playlist'] = playlist_index
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        counts['errors'] += 1
+                        yield dict(event, type='error', error=describe_error(e))
+                        continue
+                    if is_source and result[0] == 'playlist':
+                        _, playlist_info, entries = result
+                        playlists.append((index, entries))
+                        counts['playlists'] += 1
+                        yield dict(event, type='playlist', **playlist_info)
+                        continue
+                    counts['media'] += 1
+                    yield dict(event, type='media', media=result[1] if is_source else result)
+        finally:
+            for future in running:
+                future.cancel()
+            for _, entries in playlists:
+                close = getattr(entries, 'close', None)
+                if close:
+                    close()
+            with self._lock:
+                self._active -= 1
+                self._stats.update(counts)
+
+        elapsed = time.monotonic() - started
+        logging.info(f"Batch analysis finished: {counts['media']} media, {counts['errors']} errors, "
+                     f"{counts['playlists']} playlists in {elapsed:.1f}s")
+        yield {'type': 'done', 'analyzed': counts['media'], 'errors': counts['errors'],
+               'playlists': counts['playlists'], 'truncated': truncated, 'elapsed': round(elapsed, 3)}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, active_batches=self._active, workers=self.workers,
+                        parallelism=self.parallelism, per_host=self.per_host)
@@ -0,0 +1,247 @@
+import os
+import threading
+import time
+import zipfile
+
+from task_store import FINISHED_STATUSES, ProgressThrottle
+
+CHUNK_SIZE = 256 * 1024
+
+
+class BatchDownloads:
+    """Bulk download jobs: one parent task whose items are ordinary download tasks.
+
+    A batch starts at most `parallelism` of its items at a time; the next item
+    is started when one finishes. Item progress is folded into per-item and
+    overall figures for the parent task, and finished items are recorded in
+    completion order so the archive stream can add them as soon as they are
+    ready.
+    """
+
+    def __init__(self, parallelism=2, min_delta=1.0, min_interval=0.5):
+        self.parallelism = parallelism
+        self.min_delta = min_delta
+        self.min_interval = min_interval
+        self._cond = threading.Condition()
+        self._batches = {}
+        self._items_by_task = {}
+
+    def create(self, batch_id, items, meta=None):
+        """Register a batch.
+
+        Args:
+            items: Download parameters (url, mediaType, ...) of each item
+            meta: Opaque value handed back by claim()
+        """
+        with self._cond:
+            self._batches[batch_id] = {
+                'items': [{'params': params, 'task_id': None, 'status': 'pending', 'percentage': 0,
+                           'name': None} for params in items],
+                'finished': [],  # item indexes in completion order
+                'running': 0,
+                'meta': meta,
+                'throttle': ProgressThrottle(self.min_delta, self.min_interval),
+                'finished_at': None,
+            }
+
+    def claim(self, batch_id):
+        """Take the pending items that may start now.
+
+        Returns:
+            list: (index, params, meta) of each item to start
+        """
+        with self._cond:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return []
+            claimed = []
+            for index, item in enumerate(batch['items']):
+                if batch['running'] >= self.parallelism:
+                    break
+                if item['status'] == 'pending':
+                    item['status'] = 'queued'
+                    batch['running'] += 1
+                    claimed.append((index, item['params'], batch['meta']))
+            return claimed
+
+    def assign(self, batch_id, index, task_id):
+        """Record the download task started for an item."""
+        with self._cond:
+            batch = self._batches.get(batch_id)
+            if batch is not None:
+                batch['items'][index]['task_id'] = task_id
+                self._items_by_task[task_id] = (batch_id, index)
+
+    def report(self, task_id, status, percentage, name=None):
+        """Record an item task's status.
+
+        Returns:
+            tuple: (batch_id, parent view or None when this tick is coalesced,
+            True if the item just finished and another may start); batch_id
+            is None when task_id is not a batch item
+        """
+        with self._cond:
+            batch_id, index = self._items_by_task.get(task_id, (None, None))
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None, None, False
+            item = batch['items'][index]
+            if item['status'] in FINISHED_STATUSES:
+                return batch_id, None, False
+            item['status'] = status or item['status']
+            item['percentage'] = 100 if status in FINISHED_STATUSES else (percentage or 0)
+            item['name'] = name or item['name']
+            just_finished = status in FINISHED_STATUSES
+            if just_finished:
+                self._finish(batch, index)
+            elif not batch['throttle'].should_emit(self._overall(batch)):
+                return batch_id, None, False
+            return batch_id, self._view(batch), just_finished
+
+    def fail_item(self, batch_id, index):
+        """An item could not be started (e.g. the download queue is full)."""
+        with self._cond:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            batch['items'][index].update(status='error', percentage=100)
+            self._finish(batch, index)
+            return self._view(batch)
+
+    def _finish(self, batch, index):
+        """Caller holds the lock."""
+        batch['finished'].append(index)
+        batch['running'] -= 1
+        if len(batch['finished']) == len(batch['items']):
+            batch['finished_at'] = time.time()
+        self._cond.notify_all()
+
+    def meta(self, batch_id):
+        with self._cond:
+            batch = self._batches.get(batch_id)
+            return batch['meta'] if batch is not None else None
+
+    def view(self, batch_id):
+        with self._cond:
+            batch = self._batches.get(batch_id)
+            return self._view(batch) if batch is not None else None
+
+    @staticmethod
+    def _overall(batch):
+        return sum(item['percentage'] for item in batch['items']) / len(batch['items'])
+
+    def _view(self, batch):
+        """Parent task fields. Caller holds the lock."""
+        items = batch['items']
+        return {
+            'percentage': round(self._overall(batch), 1),
+            'total': len(items),
+            'completed': sum(1 for item in items if item['status'] == 'complete'),
+            'failed': sum(1 for item in items if item['status'] == 'error'),
+            'done': len(batch['finished']) == len(items),
+            'items': [{'url': item['params'].get('url'), 'task_id': item['task_id'], 'status': item['status'],
+                       'percentage': round(item['percentage'], 1), 'name': item['name']} for item in items],
+        }
+
+    def wait_finished(self, batch_id, position, timeout=None):
+        """Block until an item beyond the first `position` finished items is done.
+
+        Returns:
+            tuple: (list of (index, task_id, status) finished after position,
+            True once every item has finished); ([], True) for unknown batches
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while True:
+                batch = self._batches.get(batch_id)
+                if batch is None:
+                    return [], True
+                finished = batch['finished'][position:]
+                all_done = len(batch['finished']) == len(batch['items'])
+                if finished or all_done:
+                    return ([(index, batch['items'][index]['task_id'], batch['items'][index]['status'])
+                             for index in finished], all_done)
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return [], False
+                self._cond.wait(remaining)
+
+    def expire(self, ttl):
+        """Forget batches finished more than ttl seconds ago; return their IDs."""
+        cutoff = time.time() - ttl
+        with self._cond:
+            expired = [batch_id for batch_id, batch in self._batches.items()
+                       if batch['finished_at'] is not None and batch['finished_at'] < cutoff]
+            for batch_id in expired:
+                for item in self._batches.pop(batch_id)['items']:
+                    self._items_by_task.pop(item['task_id'], None)
+            return expired
+
+    def __len__(self):
+        with self._cond:
+            return len(self._batches)
+
+
+class _StreamBuffer:
+    """Write-only, unseekable file object collecting what zipfile writes."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def unique_archive_name(name, used):
+    """Archive member name for name that does not clash with the names in used."""
+    base, ext = os.path.splitext(name)
+    candidate, n = name, 2
+    while candidate in used:
+        candidate = f'{base} ({n}){ext}'
+        n += 1
+    used.add(candidate)
+    return candidate
+
+
+def zip_stream(files, chunk_size=CHUNK_SIZE):
+    """Yield a ZIP archive of files while it is being written.
+
+    Members are stored without compression (media files are already
+    compressed), so each one costs a single read of its file. Because the
+    output is not seekable, zipfile writes sizes and CRCs in data descriptors
+    after each member, and switches to ZIP64 records for large files, so
+    nothing but the current chunk is ever held in memory or written to disk.
+
+    Args:
+        files: Iterable of (file_path, archive_name, on_done) tuples, consumed
+            lazily; on_done() is called after the member was written (may be None)
+    """
+    buffer = _StreamBuffer()
+    used_names = set()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for file_path, name, on_done in files:
+            stat = os.stat(file_path)
+            info = zipfile.ZipInfo(unique_archive_name(name, used_names),
+                                   date_time=time.localtime(stat.st_mtime)[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = stat.st_size
+            with open(file_path, 'rb') as src, archive.open(info, 'w') as dest:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield buffer.drain()
+            if on_done:
+                on_done()
+    # Data descriptor of the last member and the central directory
+    yield buffer.drain()
@@ -0,0 +1,530 @@
+"""Offline load test and benchmark for the backend.
+
+Generates fixture media with ffmpeg (a progressive MP4 and the same content
+as HLS and DASH), serves it from a local HTTP origin that yt-dlp's generic
+extractor handles, starts `python app.py` against it and drives the API:
+
+    analyze         POST /api/analyze, a new URL per request (full extraction)
+    analyze-cached  POST /api/analyze, one URL (analysis cache hits)
+    download        POST /api/download until the task completes (MP4, HLS, DASH)
+    stream-progress GET /api/stream-progress, several clients per running download
+    get-file        GET /api/get-file of finished downloads
+
+Each scenario reports requests/sec, p50/p99 latency and time to first byte;
+the server's peak RSS (its process tree) and temp-disk usage are sampled
+throughout. Results are compared with the baseline file, or saved as the new
+baseline with --save-baseline.
+
+Usage:
+    python benchmark.py --save-baseline      # record the baseline
+    python benchmark.py                      # compare against it
+    python benchmark.py --scenarios analyze,get-file --requests 50
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'benchmark_baseline.json')
+SCENARIOS = ('analyze', 'analyze-cached', 'download', 'stream-progress', 'get-file')
+FIXTURE_PATHS = {'mp4': 'progressive.mp4', 'hls': 'hls/index.m3u8', 'dash': 'dash/manifest.mpd'}
+# Worse by more than this fraction than the baseline counts as a regression
+DEFAULT_TOLERANCE = 0.2
+
+
+# --- Fixture media and origin ---
+def generate_fixtures(fixture_dir, seconds):
+    """Create the MP4/HLS/DASH fixtures with ffmpeg (skipped if already present)."""
+    if all(os.path.exists(os.path.join(fixture_dir, path)) for path in FIXTURE_PATHS.values()):
+        return
+    if not shutil.which('ffmpeg'):
+        sys.exit('ffmpeg is required to generate the benchmark fixtures')
+    os.makedirs(os.path.join(fixture_dir, 'hls'), exist_ok=True)
+    os.makedirs(os.path.join(fixture_dir, 'dash'), exist_ok=True)
+    progressive = os.path.join(fixture_dir, FIXTURE_PATHS['mp4'])
+    commands = [
+        ['-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={seconds}',
+         '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={seconds}',
+         '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', '2M', '-g', '60',
+         '-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart', progressive],
+        ['-i', progressive, '-c', 'copy', '-f', 'hls', '-hls_time', '2', '-hls_playlist_type', 'vod',
+         '-hls_segment_filename', os.path.join(fixture_dir, 'hls', 'segment%03d.ts'),
+         os.path.join(fixture_dir, FIXTURE_PATHS['hls'])],
+        ['-i', progressive, '-map', '0:v', '-map', '0:a', '-c', 'copy', '-f', 'dash', '-seg_duration', '2',
+         '-use_template', '1', '-use_timeline', '0', os.path.join(fixture_dir, FIXTURE_PATHS['dash'])],
+    ]
+    for command in commands:
+        subprocess.run(['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error'] + command, check=True)
+
+
+class OriginHandler(SimpleHTTPRequestHandler):
+    """Static fixture files with single-range support and optional per-connection throttling."""
+
+    extensions_map = dict(SimpleHTTPRequestHandler.extensions_map, **{
+        '.m3u8': 'application/vnd.apple.mpegurl', '.mpd': 'application/dash+xml',
+        '.ts': 'video/mp2t', '.m4s': 'video/iso.segment', '.mp4': 'video/mp4',
+    })
+    rate = 0  # bytes/s per response, 0 = unlimited
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.end_headers()
+                return None
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        f = open(path, 'rb')
+        f.seek(start)
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        chunk_size = 64 * 1024
+        started = time.monotonic()
+        sent = 0
+        while self._remaining > 0:
+            chunk = source.read(min(chunk_size, self._remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            sent += len(chunk)
+            self._remaining -= len(chunk)
+            if self.rate:
+                ahead = sent / self.rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+
+class OriginServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)  # clients closing early is expected
+
+
+def start_origin(fixture_dir, rate):
+    handler = type('Handler', (OriginHandler,), {'rate': rate})
+    server = OriginServer(('127.0.0.1', 0), lambda *args: handler(*args, directory=fixture_dir))
+    thread = threading.Thread(target=server.serve_forever, name='bench-origin')
+    thread.daemon = True
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+# --- Server under test ---
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(work_dir, extra_env):
+    port = free_port()
+    env = dict(os.environ, FLASK_PORT=str(port), TEMP_DIR=os.path.join(work_dir, 'tmp'), USE_PROXY='false',
+               ARTIFACT_DELETE_DELAY='3600', ANALYSIS_CACHE_DIR='')
+    env.update(extra_env)
+    log = open(os.path.join(work_dir, 'server.log'), 'wb')
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=BACKEND_DIR, env=env, stdout=log, stderr=log)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f'Server exited during startup; see {log.name}')
+        try:
+            if requests.get(f'{base_url}/health', timeout=1).json().get('ready'):
+                return process, base_url, env['TEMP_DIR']
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.2)
+    process.kill()
+    sys.exit(f'Server did not become ready; see {log.name}')
+
+
+class ResourceSampler:
+    """Samples the RSS of a process tree and the size of a directory, keeping the peaks."""
+
+    def __init__(self, pid, directory, interval=0.1):
+        self.pid = pid
+        self.directory = directory
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self._stop = threading.Event()
+
+    def _tree(self, pid):
+        pids = [pid]
+        try:
+            for task in os.listdir(f'/proc/{pid}/task'):
+                with open(f'/proc/{pid}/task/{task}/children') as f:
+                    for child in f.read().split():
+                        pids.extend(self._tree(int(child)))
+        except OSError:
+            pass
+        return pids
+
+    def rss(self):
+        total = 0
+        for pid in self._tree(self.pid):
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            total += int(line.split()[1]) * 1024
+            except OSError:
+                pass
+        return total
+
+    def disk(self):
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def reset(self):
+        self.peak_rss = self.rss()
+        self.peak_disk = self.disk()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self.rss())
+            self.peak_disk = max(self.peak_disk, self.disk())
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name='bench-sampler')
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+# --- Load generation ---
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run_load(fn, total, concurrency):
+    """Call fn(i) for i in range(total) from `concurrency` threads.
+
+    fn returns a dict with 'latency' and optionally 'ttfb' and 'bytes'
+    (seconds and bytes), or raises on failure.
+    """
+    results, errors = [], []
+    started = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in concurrent.futures.as_completed([executor.submit(fn, i) for i in range(total)]):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors.append(str(e))
+    return summarize(results, errors, time.monotonic() - started)
+
+
+def summarize(results, errors, wall=None):
+    """Report of a scenario's successful results and error messages; rates need the wall time."""
+    latencies = [r['latency'] for r in results]
+    ttfbs = [r['ttfb'] for r in results if r.get('ttfb') is not None]
+    transferred = sum(r.get('bytes', 0) for r in results)
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+    report = {
+        'requests': len(results) + len(errors),
+        'errors': len(errors),
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'ttfb_p50_ms': ms(percentile(ttfbs, 50)),
+        'ttfb_p99_ms': ms(percentile(ttfbs, 99)),
+    }
+    if wall:
+        report['rps'] = round(len(results) / wall, 2)
+        report['wall_s'] = round(wall, 2)
+        if transferred:
+            report['mb_per_s'] = round(transferred / wall / 1e6, 1)
+    if errors:
+        report['first_error'] = errors[0][:200]
+    return report
+
+
+def timed_post(url, payload):
+    started = time.monotonic()
+    response = requests.post(url, json=payload, timeout=300)
+    latency = time.monotonic() - started
+    response.raise_for_status()
+    return response, latency
+
+
+def read_events(response):
+    """Yield the JSON payloads of an SSE response."""
+    for line in response.iter_lines(decode_unicode=True):
+        if line and line.startswith('data: '):
+            yield json.loads(line[6:])
+
+
+class Benchmark:
+    def __init__(self, base_url, origin_url, args):
+        self.base_url = base_url
+        self.origin_url = origin_url
+        self.args = args
+        self.completed = []  # download_url of finished downloads, for get-file
+        self._lock = threading.Lock()
+        self._unique = 0
+
+    def fixture_url(self, kind, unique=True):
+        """URL of a fixture; unique URLs defeat the analysis cache and download sharing."""
+        url = f'{self.origin_url}/{FIXTURE_PATHS[kind]}'
+        if unique:
+            with self._lock:
+                self._unique += 1
+                url += f'?n={self._unique}-{time.time_ns()}'
+        return url
+
+    def kinds(self):
+        return self.args.kinds.split(',')
+
+    def analyze(self, unique):
+        kinds = self.kinds()
+
+        def request(i):
+            _, latency = timed_post(f'{self.base_url}/api/analyze',
+                                    {'url': self.fixture_url(kinds[i % len(kinds)], unique)})
+            return {'latency': latency, 'ttfb': latency}
+        if not unique:
+            request(0)  # warm the cache entry
+        return run_load(request, self.args.requests, self.args.concurrency)
+
+    def download(self, i, kind=None, subscribers=0):
+        """Start one download and follow its progress stream to completion."""
+        kinds = self.kinds()
+        kind = kind or kinds[i % len(kinds)]
+        started = time.monotonic()
+        response, submit_latency = timed_post(f'{self.base_url}/api/download', {
+            'url': self.fixture_url(kind), 'mediaType': 'video', 'formatType': 'mp4', 'quality': 'best'})
+        task_id = response.json()['task_id']
+        fan_out = [threading.Thread(target=self._subscribe, args=(task_id,)) for _ in range(subscribers)]
+        for thread in fan_out:
+            thread.start()
+        try:
+            with requests.get(f'{self.base_url}/api/stream-progress/{task_id}', stream=True, timeout=600) as stream:
+                for event in read_events(stream):
+                    if event.get('status') == 'error':
+                        raise RuntimeError(f'{kind} download failed: {event.get("message")}')
+                    if event.get('status') == 'complete':
+                        with self._lock:
+                            self.completed.append(event['download_url'])
+                        break
+        finally:
+            for thread in fan_out:
+                thread.join()
+        return {'latency': time.monotonic() - started, 'ttfb': submit_latency}
+
+    def _subscribe(self, task_id):
+        started = time.monotonic()
+        first_event = None
+        try:
+            with requests.get(f'{self.base_url}/api/stream-progress/{task_id}', stream=True, timeout=600) as stream:
+                for event in read_events(stream):
+                    if first_event is None:
+                        first_event = time.monotonic() - started
+                    if event.get('status') in ('complete', 'error'):
+                        break
+            with self._lock:
+                self._subscriptions.append({'latency': time.monotonic() - started, 'ttfb': first_event})
+        except Exception as e:
+            with self._lock:
+                self._subscription_errors.append(str(e))
+
+    def stream_progress(self):
+        """Downloads with extra progress subscribers each; reports the subscribers.
+
+        Latency is a subscriber's time from connecting to the final event,
+        TTFB its time to the first event.
+        """
+        self._subscriptions, self._subscription_errors = [], []
+        downloads = max(1, self.args.requests // max(1, self.args.subscribers))
+        run_load(lambda i: self.download(i, subscribers=self.args.subscribers),
+                 downloads, self.args.concurrency)
+        report = summarize(self._subscriptions, self._subscription_errors)
+        report['downloads'] = downloads
+        return report
+
+    def get_file(self):
+        if not self.completed:
+            for kind in self.kinds():
+                self.download(0, kind)
+        links = list(self.completed)
+
+        def fetch(i):
+            started = time.monotonic()
+            ttfb = None
+            received = 0
+            with requests.get(self.base_url + links[i % len(links)], stream=True, timeout=300) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(256 * 1024):
+                    if ttfb is None:
+                        ttfb = time.monotonic() - started
+                    received += len(chunk)
+            return {'latency': time.monotonic() - started, 'ttfb': ttfb, 'bytes': received}
+        return run_load(fetch, self.args.requests, self.args.concurrency)
+
+    def run(self, name):
+        if name == 'analyze':
+            return self.analyze(unique=True)
+        if name == 'analyze-cached':
+            return self.analyze(unique=False)
+        if name == 'download':
+            return run_load(self.download, max(1, self.args.requests // 4), self.args.concurrency)
+        if name == 'stream-progress':
+            return self.stream_progress()
+        if name == 'get-file':
+            return self.get_file()
+        raise ValueError(name)
+
+
+# --- Baseline ---
+# Metric -> True when higher is better
+COMPARED_METRICS = {'rps': True, 'mb_per_s': True, 'p50_ms': False, 'p99_ms': False,
+                    'ttfb_p50_ms': False, 'ttfb_p99_ms': False, 'peak_rss_mb': False, 'peak_temp_disk_mb': False}
+
+
+def compare(results, baseline, tolerance):
+    """Print each metric next to its baseline value; return the regressions."""
+    regressions = []
+    for name, report in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        print(f'\n{name}')
+        for metric, value in report.items():
+            line = f'  {metric:<18} {value}'
+            before = (base or {}).get(metric)
+            if metric in COMPARED_METRICS and isinstance(value, (int, float)) and before:
+                change = (value - before) / before
+                worse = -change if COMPARED_METRICS[metric] else change
+                line += f'   (baseline {before}, {change:+.0%})'
+                # Tiny absolute values are noise; only flag differences above 1 ms / 1 MB
+                if worse > tolerance and abs(value - before) >= 1:
+                    line += '  REGRESSION'
+                    regressions.append(f'{name}.{metric}')
+            print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test against a local fake media origin.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated subset of ' + ', '.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=40, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--subscribers', type=int, default=10, help='Progress streams per download (stream-progress)')
+    parser.add_argument('--kinds', default='mp4,hls,dash', help='Fixture formats used: mp4, hls, dash')
+    parser.add_argument('--fixture-seconds', type=int, default=20, help='Length of the generated fixture media')
+    parser.add_argument('--fixture-dir', default=os.path.join(tempfile.gettempdir(), 'hqmx-bench-fixtures'))
+    parser.add_argument('--origin-rate', type=int, default=0, help='Origin bytes/s per response (0 = unlimited)')
+    parser.add_argument('--server-env', action='append', default=[], metavar='NAME=VALUE',
+                        help='Extra environment for the server (e.g. DOWNLOAD_WORKERS=8)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    generate_fixtures(args.fixture_dir, args.fixture_seconds)
+    origin, origin_url = start_origin(args.fixture_dir, args.origin_rate)
+    work_dir = tempfile.mkdtemp(prefix='hqmx-bench-')
+    server_env = dict(item.split('=', 1) for item in args.server_env)
+    process, base_url, temp_dir = start_server(work_dir, server_env)
+    sampler = ResourceSampler(process.pid, temp_dir)
+    sampler.start()
+
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'settings': {k: getattr(args, k) for k in ('requests', 'concurrency', 'subscribers', 'kinds',
+                                                   'fixture_seconds', 'origin_rate')},
+        'server_env': server_env,
+        'idle_rss_mb': round(sampler.rss() / 1e6, 1),
+        'scenarios': {},
+    }
+    benchmark = Benchmark(base_url, origin_url, args)
+    try:
+        for name in scenarios:
+            print(f'Running {name}...', flush=True)
+            sampler.reset()
+            report = benchmark.run(name)
+            report['peak_rss_mb'] = round(sampler.peak_rss / 1e6, 1)
+            report['peak_temp_disk_mb'] = round(sampler.peak_disk / 1e6, 1)
+            results['scenarios'][name] = report
+    finally:
+        sampler.stop()
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        origin.shutdown()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    print(f'\nServer log: {os.path.join(work_dir, "server.log")}')
+
+    for path in filter(None, [args.output, args.baseline if args.save_baseline else None]):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results written to {path}')
+    if regressions and not args.save_baseline:
+        print(f'Regressions against {args.baseline}: {", ".join(regressions)}')
+        sys.exit(1)
+    shutil.rmtree(os.path.join(work_dir, 'tmp'), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+
+from yt_dlp.utils import parse_duration
+
+
+def parse_clip_time(value):
+    """Seconds from a number or a time string ('90', '1:30', '1h2m3s'); None when empty.
+
+    Raises:
+        ValueError: The value is not a time
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        seconds = float(value)
+    else:
+        seconds = parse_duration(str(value))
+        if seconds is None:
+            raise ValueError(f'invalid time: {value!r}')
+    if seconds < 0:
+        raise ValueError(f'negative time: {value!r}')
+    return seconds
+
+
+def parse_clip_range(start, end):
+    """(start, end) seconds of a requested clip, or None for the whole media.
+
+    Raises:
+        ValueError: A time is invalid, or end is not after start
+    """
+    start, end = parse_clip_time(start), parse_clip_time(end)
+    if start is None and end is None:
+        return None
+    if end is not None and end <= (start or 0):
+        raise ValueError('end must be after start')
+    return (start or 0.0, end)
+
+
+def format_clip_time(seconds):
+    """'1h02m03s' / '2m03s' / '45s' for a clip bound: safe in file names, and parsed back by parse_clip_time()."""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f'{hours}h{minutes:02d}m{seconds:02d}s'
+    return f'{minutes}m{seconds:02d}s' if minutes else f'{seconds}s'
+
+
+class ClipRange:
+    """yt-dlp download_ranges callable for one start/end window.
+
+    yt-dlp then downloads the window with ffmpeg, which seeks the input to
+    the keyframe before start and stream-copies until end, so only the
+    byte ranges (or HLS/DASH fragments) covering the window are fetched.
+    The clip's actual length (end clamped to the media's duration) is
+    recorded in self.length when the range is applied.
+    """
+
+    def __init__(self, start, end=None):
+        self.start = start
+        self.end = end
+        self.length = None
+
+    def __call__(self, info_dict, ydl):
+        duration = info_dict.get('duration')
+        end = self.end
+        if duration and (end is None or end > duration):
+            end = duration
+        self.length = end - self.start if end is not None else None
+        yield {'start_time': self.start, 'end_time': end if end is not None else float('inf')}
+
+
+class ClipProgress:
+    """Reports the progress of yt-dlp's ffmpeg section download against the clip's length.
+
+    yt-dlp's ffmpeg downloader sends no progress events until the clip is
+    done; ffmpeg is told to write its progress to `path` ('-progress'), and
+    a thread follows that file and passes yt-dlp style 'downloading' events
+    to on_progress, with the percentage of the clip written so far.
+    """
+
+    def __init__(self, path, clip, on_progress, interval=0.5):
+        """
+        Args:
+            path: File ffmpeg writes its progress to
+            clip: The ClipRange of the download
+            on_progress: Progress hook called with yt-dlp style status dicts
+            interval: Seconds between reads of the progress file
+        """
+        self.path = path
+        self.clip = clip
+        self.on_progress = on_progress
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def ffmpeg_args(self):
+        """yt-dlp external_downloader_args that make ffmpeg write the progress file."""
+        return {'ffmpeg_o': ['-progress', self.path, '-nostats']}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='clip-progress')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def _run(self):
+        started = time.monotonic()
+        offset, pending, values = 0, '', {}
+        while not self._stop.wait(self.interval):
+            try:
+                if os.path.getsize(self.path) < offset:
+                    # ffmpeg restarted the file (next format of a separate-stream download)
+                    offset, pending, values = 0, '', {}
+                with open(self.path, 'rb') as f:
+                    f.seek(offset)
+                    chunk = f.read().decode('utf-8', errors='replace')
+                    offset = f.tell()
+            except OSError:
+                continue  # ffmpeg has not started yet
+            lines = (pending + chunk).split('\n')
+            pending = lines.pop()
+            report = None
+            for line in lines:
+                key, _, value = line.strip().partition('=')
+                values[key] = value
+                if key == 'progress':
+                    report = dict(values)
+            if report is not None:
+                self._report(report, time.monotonic() - started)
+
+    def _report(self, values, elapsed):
+        try:
+            written = int(values.get('total_size') or 0)
+            out_seconds = int(values.get('out_time_us') or 0) / 1000000
+        except ValueError:
+            return  # 'N/A' before the first packet
+        length = self.clip.length
+        percentage = min(100.0, out_seconds / length * 100) if length else None
+        self.on_progress({
+            'status': 'downloading',
+            'downloaded_bytes': written,
+            'elapsed': elapsed,
+            'speed': written / elapsed if elapsed else None,
+            '_percent_str': f'{percentage:.1f}%' if percentage is not None else 'N/A',
+        })
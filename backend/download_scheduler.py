@@ -0,0 +1,229 @@
+import collections
+import logging
+import threading
+import time
+
+# Priority classes, lowest value is served first
+PRIORITY_AUDIO = 0
+PRIORITY_VIDEO = 1
+PRIORITY_HEAVY_VIDEO = 2
+PRIORITY_CLASSES = (PRIORITY_AUDIO, PRIORITY_VIDEO, PRIORITY_HEAVY_VIDEO)
+
+
+class QueueFull(Exception):
+    """Raised by DownloadScheduler.submit when the queue is at capacity."""
+
+
+class DownloadScheduler:
+    """Fixed-size worker pool that runs download jobs from a bounded priority queue.
+
+    Jobs wait in one FIFO per priority class. Workers take the head of the
+    highest-priority class, except that a head which has waited longer than
+    starvation_seconds is served first, and at most max_heavy workers run
+    PRIORITY_HEAVY_VIDEO jobs at once so long merges never occupy the whole pool.
+
+    on_queue_change(task_id, position, meta) is called outside the lock when a
+    queued job's 1-based position crosses a reporting step (every position up
+    to exact_positions, then every multiple of position_step), and with
+    position None when the job is handed to a worker.
+
+    A job still running job_timeout seconds after it started gives its worker
+    slot back: a replacement worker is started, timed_out(task_id) turns True
+    for the job to notice and abort, and on_timeout(task_id, meta) is called.
+    The thread of a hung job exits once the job returns.
+    """
+
+    def __init__(self, workers=4, max_queue=100, max_heavy=None, starvation_seconds=60, on_queue_change=None,
+                 job_timeout=None, on_timeout=None, exact_positions=10, position_step=10):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_heavy = max_heavy if max_heavy is not None else max(1, workers // 2)
+        self.starvation_seconds = starvation_seconds
+        self.on_queue_change = on_queue_change
+        self.job_timeout = job_timeout
+        self.on_timeout = on_timeout
+        self.exact_positions = exact_positions
+        self.position_step = position_step
+        self._queues = {priority: collections.deque() for priority in PRIORITY_CLASSES}
+        self._cond = threading.Condition()
+        self._running = 0
+        self._running_heavy = 0
+        self._positions = {}
+        self._reported = {}  # task_id -> reporting step of the last published position
+        self._active = {}  # task_id -> running job
+        self._timed_out = set()
+        self._threads = []
+        self._stats = collections.Counter()
+
+    def start(self):
+        for _ in range(self.workers):
+            self._start_worker()
+        if self.job_timeout:
+            watchdog = threading.Thread(target=self._watchdog_loop, name='download-watchdog')
+            watchdog.daemon = True
+            watchdog.start()
+        logging.info(f"Download scheduler started with {self.workers} workers (queue limit {self.max_queue})")
+
+    def _start_worker(self):
+        thread = threading.Thread(target=self._worker_loop, name=f'download-worker-{len(self._threads)}')
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _queued_count(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, task_id, fn, args=(), priority=PRIORITY_VIDEO, meta=None):
+        """Queue fn(*args) to run on a worker.
+
+        Returns:
+            int: 1-based queue position of the job
+
+        Raises:
+            QueueFull: if max_queue jobs are already waiting
+        """
+        job = {'task_id': task_id, 'fn': fn, 'args': args, 'priority': priority,
+               'meta': meta, 'enqueued_at': time.monotonic()}
+        with self._cond:
+            if self._queued_count() >= self.max_queue:
+                self._stats['rejected'] += 1
+                raise QueueFull(f"Download queue is full ({self.max_queue} waiting)")
+            self._queues[priority].append(job)
+            self._stats['submitted'] += 1
+            changes = self._recompute_positions()
+            position = self._positions[task_id]
+            self._cond.notify()
+        self._publish(changes)
+        return position
+
+    def _dispatch_order(self):
+        """Queued jobs in the order workers would take them right now."""
+        order = []
+        for priority in PRIORITY_CLASSES:
+            order.extend(self._queues[priority])
+        return order
+
+    def _reporting_step(self, position):
+        if position <= self.exact_positions:
+            return position
+        return self.exact_positions + (position - self.exact_positions) // self.position_step + 1
+
+    def _recompute_positions(self):
+        """Refresh queue positions; returns the changes worth publishing."""
+        changes = []
+        positions = {}
+        reported = {}
+        for position, job in enumerate(self._dispatch_order(), start=1):
+            task_id = job['task_id']
+            positions[task_id] = position
+            # Far back in a long queue every dispatch moves everyone by one; only steps are published
+            reported[task_id] = self._reporting_step(position)
+            if self._reported.get(task_id) != reported[task_id]:
+                changes.append((task_id, position, job['meta']))
+        self._positions = positions
+        self._reported = reported
+        return changes
+
+    def _publish(self, changes):
+        if not self.on_queue_change:
+            return
+        for task_id, position, meta in changes:
+            try:
+                self.on_queue_change(task_id, position, meta)
+            except Exception as e:
+                logging.error(f"Queue position callback failed for task {task_id}: {e}")
+
+    def _next_job(self):
+        """Pop the next runnable job, or None. Caller holds the lock."""
+        heavy_allowed = self._running_heavy < self.max_heavy
+        candidates = [priority for priority in PRIORITY_CLASSES
+                      if self._queues[priority] and (priority != PRIORITY_HEAVY_VIDEO or heavy_allowed)]
+        if not candidates:
+            return None
+
+        # Starvation guard: the longest-waiting head goes first once it is overdue
+        now = time.monotonic()
+        oldest = min(candidates, key=lambda priority: self._queues[priority][0]['enqueued_at'])
+        if now - self._queues[oldest][0]['enqueued_at'] > self.starvation_seconds:
+            return self._queues[oldest].popleft()
+        return self._queues[candidates[0]].popleft()
+
+    def _release(self, job):
+        """Give a running job's slot back. Caller holds the lock."""
+        self._active.pop(job['task_id'], None)
+        self._running -= 1
+        if job['priority'] == PRIORITY_HEAVY_VIDEO:
+            self._running_heavy -= 1
+        # A finished heavy job may unblock heavy work for any idle worker
+        self._cond.notify_all()
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                self._running += 1
+                if job['priority'] == PRIORITY_HEAVY_VIDEO:
+                    self._running_heavy += 1
+                now = time.monotonic()
+                self._stats['queue_wait_total'] += now - job['enqueued_at']
+                job['deadline'] = now + self.job_timeout if self.job_timeout else None
+                self._active[job['task_id']] = job
+                changes = self._recompute_positions()
+            self._publish([(job['task_id'], None, job['meta'])] + changes)
+
+            try:
+                job['fn'](*job['args'])
+            except Exception:
+                logging.exception(f"Download job for task {job['task_id']} raised")
+            finally:
+                with self._cond:
+                    if job.get('timed_out'):
+                        # The watchdog gave this slot to a replacement worker
+                        self._timed_out.discard(job['task_id'])
+                        return
+                    self._release(job)
+                    self._stats['completed'] += 1
+
+    def timed_out(self, task_id):
+        """Whether task_id's job ran past job_timeout; a job checks this to abort."""
+        return task_id in self._timed_out
+
+    def _watchdog_loop(self):
+        while True:
+            time.sleep(min(self.job_timeout, 5))
+            now = time.monotonic()
+            expired = []
+            with self._cond:
+                for job in list(self._active.values()):
+                    if job['deadline'] <= now:
+                        job['timed_out'] = True
+                        self._timed_out.add(job['task_id'])
+                        self._release(job)
+                        self._stats['timed_out'] += 1
+                        self._start_worker()
+                        expired.append(job)
+            for job in expired:
+                logging.warning(f"Download job for task {job['task_id']} exceeded {self.job_timeout}s, "
+                                f"releasing its worker")
+                if self.on_timeout:
+                    try:
+                        self.on_timeout(job['task_id'], job['meta'])
+                    except Exception as e:
+                        logging.error(f"Timeout callback failed for task {job['task_id']}: {e}")
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'running': self._running,
+                'running_heavy': self._running_heavy,
+                'queued': self._queued_count(),
+                'queued_by_priority': {str(priority): len(queue) for priority, queue in self._queues.items()},
+                'submitted': self._stats['submitted'],
+                'completed': self._stats['completed'],
+                'rejected': self._stats['rejected'],
+                'timed_out': self._stats['timed_out'],
+            }
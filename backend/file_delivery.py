@@ -0,0 +1,114 @@
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import socket
+import time
+import zlib
+from urllib.parse import quote
+
+from flask import Response
+
+from stream_delivery import attachment_headers
+
+CHUNK_SIZE = 256 * 1024
+
+
+class FileDelivery:
+    """Sends finished download files: signed links, ranges, validators, zero-copy.
+
+    Links carry an expiry and an HMAC of the task ID, so a file can only be
+    fetched through a URL the API handed out recently. Responses support
+    Range/If-Range and ETag/Last-Modified validation; the body goes out with
+    socket.sendfile() when the server exposes the client socket (the built-in
+    Werkzeug server does), otherwise it is read in chunks. With accel_prefix
+    set, the response only carries an X-Accel-Redirect header and nginx
+    serves the file, so no Python thread is held for the transfer.
+    """
+
+    def __init__(self, secret=None, link_ttl=3600, accel_prefix=None, accel_root=None):
+        # A random secret only works while every link is served by this process
+        self.secret = (secret or secrets.token_hex(32)).encode('utf-8')
+        self.link_ttl = link_ttl
+        self.accel_prefix = accel_prefix.rstrip('/') + '/' if accel_prefix else None
+        self.accel_root = accel_root
+
+    def _signature(self, task_id, expires):
+        return hmac.new(self.secret, f'{task_id}:{expires}'.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def link(self, task_id):
+        """Return the signed, expiring /api/get-file URL path for task_id."""
+        expires = int(time.time()) + self.link_ttl
+        return f'/api/get-file/{task_id}?expires={expires}&sig={self._signature(task_id, expires)}'
+
+    def verify(self, task_id, expires, signature):
+        """Check the expires/sig query parameters of a get-file request."""
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._signature(task_id, expires), signature or '')
+
+    def response(self, environ, file_path, download_name, on_complete=None):
+        """Build the response for a whole-file or ranged GET of file_path.
+
+        Args:
+            environ: WSGI environ of the request (conditional and Range headers)
+            file_path: File to send
+            download_name: Name offered in Content-Disposition
+            on_complete: Called once a response has delivered the last byte
+                of the file (not called for offloaded responses)
+        """
+        if self.accel_prefix:
+            return self._offload(file_path, download_name)
+
+        stat = os.stat(file_path)
+        response = Response(status=200, headers=attachment_headers(download_name))
+        response.set_etag(f'{stat.st_mtime}-{stat.st_size}-{zlib.adler32(file_path.encode("utf-8")) & 0xffffffff}')
+        response.last_modified = int(stat.st_mtime)
+        response.cache_control.no_cache = True
+        response.content_length = stat.st_size
+        # Sets 206 + Content-Range, 304/412 or raises 416
+        response.make_conditional(environ, accept_ranges=True, complete_length=stat.st_size)
+        if response.status_code not in (200, 206):
+            return response
+
+        start, length = 0, stat.st_size
+        if response.status_code == 206:
+            start = response.content_range.start
+            length = response.content_range.stop - start
+        at_end = start + length == stat.st_size
+        response.response = self._body(
+            file_path, start, length, environ.get('werkzeug.socket'), on_complete if at_end else None)
+        return response
+
+    def _offload(self, file_path, download_name):
+        relative_path = os.path.relpath(file_path, self.accel_root)
+        headers = attachment_headers(download_name)
+        headers['X-Accel-Redirect'] = self.accel_prefix + quote(relative_path)
+        logging.info(f"Offloading {file_path} to nginx as {headers['X-Accel-Redirect']}")
+        return Response(status=200, headers=headers)
+
+    def _body(self, file_path, start, length, sock, on_complete):
+        with open(file_path, 'rb') as f:
+            try:
+                if sock is not None:
+                    yield b''  # makes the server flush the headers before the socket is written to
+                    sent = sock.sendfile(f, start, length)
+                else:
+                    f.seek(start)
+                    sent = 0
+                    while sent < length:
+                        chunk = f.read(min(CHUNK_SIZE, length - sent))
+                        if not chunk:
+                            break
+                        sent += len(chunk)
+                        yield chunk
+            except (ConnectionError, socket.timeout) as e:
+                logging.info(f"Client went away while sending {file_path}: {e}")
+                return
+        if sent == length and on_complete:
+            on_complete()
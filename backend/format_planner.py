@@ -0,0 +1,304 @@
+import logging
+
+DIRECT, REMUX, TRANSCODE = 'direct', 'remux', 'transcode'
+# Cheapest first
+PLAN_KINDS = (DIRECT, REMUX, TRANSCODE)
+
+# Estimated CPU seconds per second of media for each post-processing step;
+# video transcodes are given for 1080p H.264 and scaled by the pixel count
+# and by the encoder of the target container
+STEP_CPU_RATES = {
+    'merge': 0.005,
+    'remux': 0.005,
+    'audio_copy': 0.005,
+    'audio_transcode': 0.02,
+    'video_transcode': 1.0,
+}
+REFERENCE_PIXELS = 1920 * 1080
+# ffmpeg's default VP9 encoder for WebM is an order of magnitude slower than x264
+VIDEO_ENCODER_FACTORS = {'webm': 15.0}
+
+# Codecs each container takes by stream copy (yt-dlp codec names up to the first '.')
+CONTAINER_CODECS = {
+    'mp4': {'avc1', 'h264', 'hev1', 'hvc1', 'hevc', 'av01', 'av1', 'mp4a', 'aac', 'mp3', 'ac-3', 'ec-3'},
+    'mov': {'avc1', 'h264', 'hev1', 'hvc1', 'hevc', 'mp4a', 'aac', 'mp3', 'ac-3'},
+    'webm': {'vp8', 'vp9', 'vp09', 'av01', 'av1', 'opus', 'vorbis'},
+    'mkv': None,  # any codec
+}
+# Source audio codecs that FFmpegExtractAudio copies into each target instead of encoding
+AUDIO_TARGET_CODECS = {
+    'mp3': {'mp3'},
+    'm4a': {'mp4a', 'aac'},
+    'aac': {'mp4a', 'aac'},
+    'opus': {'opus'},
+    'vorbis': {'vorbis'},
+    'flac': {'flac'},
+    'alac': {'alac'},
+    'wav': set(),
+}
+# A source stream is copied only when its bitrate is at least this share of the
+# requested one (or of the best available one when no bitrate was requested)
+BITRATE_TOLERANCE = 0.8
+
+
+def codec_name(codec):
+    """'avc1' for 'avc1.64001F'; None for 'none' and unknown codecs."""
+    if not codec or codec == 'none':
+        return None
+    return codec.split('.')[0].lower()
+
+
+def copyable(container, *codecs):
+    """Whether streams with these codecs go into container without re-encoding.
+
+    Returns:
+        bool or None: None when a codec is unknown
+    """
+    accepted = CONTAINER_CODECS.get(container)
+    names = [codec_name(codec) for codec in codecs if codec != 'none']
+    if None in names:
+        return None
+    return accepted is None or all(name in accepted for name in names)
+
+
+def estimate_duration(formats):
+    """Media duration in seconds from the first format that gives it (or its size and bitrate), or None."""
+    for f in formats:
+        if f.get('duration'):
+            return f['duration']
+        size = f.get('filesize') or f.get('filesize_approx')
+        if size and f.get('tbr'):
+            return size * 8 / (f['tbr'] * 1000)
+    return None
+
+
+def _within(f, max_height, max_fps):
+    return ((max_height is None or (f.get('height') or 0) <= max_height)
+            and (max_fps is None or (f.get('fps') or 0) <= max_fps))
+
+
+def plan_video(formats, container, max_height=None, max_fps=None, stream=False):
+    """Cheapest-to-finish video selection at the best quality rung.
+
+    Plans that need no re-encode (a progressive file in the container, a
+    remux or a stream-copy merge) win over transcodes; among those the
+    highest height/fps rung wins, then the cheaper kind, then yt-dlp's own
+    preference order. A transcode is planned only when nothing can be copied
+    into the container. With stream, a file that needs no post-processing
+    at all wins at its height over higher frame rates, so that it can be
+    delivered while it downloads.
+
+    Args:
+        formats: yt-dlp's format list (sorted worst to best)
+        container: Requested container ('mp4', 'webm', 'mov', 'mkv')
+        max_height: Highest height allowed (None for any)
+        max_fps: Highest frame rate allowed (None for any)
+        stream: Prefer a direct file (streaming delivery was requested)
+
+    Returns:
+        dict or None: 'kind', 'formats' (one, or video and audio), 'steps',
+        'target', 'merge_output_format' and 'postprocessors'; None without
+        video formats
+    """
+    videos = [f for f in formats if f.get('vcodec') != 'none']
+    audios = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none')]
+    within = [f for f in videos if _within(f, max_height, max_fps)]
+    # Like the 'best' fallback of a height-limited format spec
+    videos = within or videos
+
+    compatible_audio = [a for a in audios if copyable(container, a.get('acodec'))]
+    best_audio = compatible_audio[-1] if compatible_audio else (audios[-1] if audios else None)
+
+    candidates = []
+    for index, video in enumerate(videos):
+        if video.get('acodec') != 'none' or best_audio is None:
+            fits = copyable(container, video.get('vcodec'), video.get('acodec'))
+            if video.get('ext') == container or fits is None:
+                # Unknown codecs are delivered in their own container, as before
+                kind, chosen, steps = DIRECT, [video], []
+            elif fits:
+                kind, chosen, steps = REMUX, [video], ['remux']
+            else:
+                kind, chosen, steps = TRANSCODE, [video], ['video_transcode']
+        else:
+            fits = copyable(container, video.get('vcodec'), best_audio.get('acodec'))
+            if fits is not False:
+                kind, chosen, steps = REMUX, [video, best_audio], ['merge']
+            else:
+                kind, chosen, steps = TRANSCODE, [video, best_audio], ['merge', 'video_transcode']
+        rank = (kind != TRANSCODE, video.get('height') or 0, stream and kind == DIRECT, video.get('fps') or 0,
+                -PLAN_KINDS.index(kind), index)
+        candidates.append((rank, kind, chosen, steps))
+    if not candidates:
+        return None
+
+    _, kind, chosen, steps = max(candidates, key=lambda candidate: candidate[0])
+    plan = {'kind': kind, 'formats': chosen, 'steps': steps, 'target': container, 'merge_output_format': container,
+            'postprocessors': []}
+    if 'remux' in steps:
+        plan['postprocessors'] = [{'key': 'FFmpegVideoRemuxer', 'preferedformat': container}]
+    elif 'video_transcode' in steps:
+        # Merge (stream copy) into a container that takes anything, then convert
+        plan['merge_output_format'] = 'mkv'
+        plan['postprocessors'] = [{'key': 'FFmpegVideoConvertor', 'preferedformat': container}]
+    return plan
+
+
+def plan_audio(formats, codec, bitrate=None, quality_arg=None, stream=False):
+    """Cheapest-to-finish audio selection.
+
+    The file itself when it already is the requested codec and container,
+    then a stream copy into the requested container, then a transcode of the
+    best audio. Copies are only planned from sources at (about) the
+    requested bitrate, so a low-quality stream is not picked for being cheap;
+    with stream, a file already in the requested codec and container is
+    taken at any bitrate, so that it can be delivered while it downloads.
+
+    Args:
+        formats: yt-dlp's format list (sorted worst to best)
+        codec: Requested audio format ('mp3', 'm4a', 'flac', ...)
+        bitrate: Requested bitrate in kbps (None for the best available)
+        quality_arg: FFmpegExtractAudio preferredquality for transcodes
+        stream: Prefer a direct file (streaming delivery was requested)
+
+    Returns:
+        dict or None: Same shape as plan_video(); None without audio formats
+    """
+    sources = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') != 'none']
+    audio_only = bool(sources)
+    if not sources:
+        sources = [f for f in formats if f.get('acodec') != 'none']
+    if not sources:
+        return None
+
+    reference = bitrate or max((f.get('abr') or f.get('tbr') or 0 for f in sources), default=0)
+    same_codec = AUDIO_TARGET_CODECS.get(codec, set())
+    candidates = []
+    for index, source in enumerate(sources):
+        source_bitrate = source.get('abr') or source.get('tbr')
+        good_enough = not source_bitrate or not reference or source_bitrate >= reference * BITRATE_TOLERANCE
+        name = codec_name(source.get('acodec'))
+        if audio_only and source.get('ext') == codec and (name in same_codec or name is None) and (good_enough or stream):
+            kind, steps = DIRECT, []
+        elif name in same_codec and good_enough:
+            kind, steps = REMUX, ['audio_copy']
+        else:
+            kind, steps = TRANSCODE, ['audio_transcode']
+        candidates.append(((-PLAN_KINDS.index(kind), index), kind, source, steps))
+
+    _, kind, source, steps = max(candidates, key=lambda candidate: candidate[0])
+    plan = {'kind': kind, 'formats': [source], 'steps': steps, 'target': codec, 'merge_output_format': None,
+            'postprocessors': []}
+    if kind != DIRECT:
+        plan['postprocessors'] = [
+            {'key': 'FFmpegExtractAudio', 'preferredcodec': codec, 'preferredquality': quality_arg},
+            {'key': 'FFmpegMetadata'},
+        ]
+    return plan
+
+
+def plan_cpu_seconds(plan, formats=()):
+    """Estimated CPU seconds of a plan's post-processing, or None when the duration is unknown.
+
+    Args:
+        formats: The whole format list, for the duration when the chosen formats do not give it
+    """
+    if not plan['steps']:
+        return 0.0
+    duration = estimate_duration(plan['formats'] + list(formats))
+    if duration is None:
+        return None
+    scale = max(((f.get('width') or 0) * (f.get('height') or 0) for f in plan['formats']), default=0)
+    total = 0.0
+    for step in plan['steps']:
+        rate = STEP_CPU_RATES[step]
+        if step == 'video_transcode':
+            rate *= VIDEO_ENCODER_FACTORS.get(plan['target'], 1.0) * (scale / REFERENCE_PIXELS if scale else 1.0)
+        total += rate * duration
+    return round(total, 1)
+
+
+class FormatPlanner:
+    """Format selector (yt-dlp's 'format' option may be a callable) that
+    picks the formats needing the cheapest post-processing.
+
+    Runs on the format list of the analyzed or freshly extracted info dict;
+    see plan_video() and plan_audio(). The chosen plan is kept in self.plan
+    (with its estimated CPU cost) and passed to on_plan. When no format can
+    be classified, selection falls back to the fallback format spec.
+
+    Merges are built by the YoutubeDL that runs the selection, which must be
+    assigned to self.ydl before it processes the info dict.
+    """
+
+    def __init__(self, media_type, format_type, max_height=None, max_fps=None, audio_bitrate=None,
+                 audio_quality_arg=None, stream=False, fallback='bestvideo*+bestaudio/best', on_plan=None):
+        """
+        Args:
+            media_type: 'video' or 'audio'
+            format_type: Requested container (video) or codec (audio)
+            max_height: Highest video height allowed (None for any)
+            max_fps: Highest frame rate allowed (None for any)
+            audio_bitrate: Requested audio bitrate in kbps (None for best)
+            audio_quality_arg: FFmpegExtractAudio preferredquality
+            stream: Prefer formats that need no post-processing (streaming delivery)
+            fallback: yt-dlp format spec used when no plan can be made
+            on_plan: Called with the reported plan (see report()) once chosen
+        """
+        self.media_type = media_type
+        self.format_type = format_type
+        self.max_height = max_height
+        self.max_fps = max_fps
+        self.audio_bitrate = audio_bitrate
+        self.audio_quality_arg = audio_quality_arg
+        self.stream = stream
+        self.fallback = fallback
+        self.on_plan = on_plan
+        self.ydl = None
+        self.plan = None
+
+    def __call__(self, ctx):
+        formats = ctx['formats']
+        if self.media_type == 'audio':
+            plan = plan_audio(formats, self.format_type, self.audio_bitrate, self.audio_quality_arg, self.stream)
+        else:
+            plan = plan_video(formats, self.format_type, self.max_height, self.max_fps, self.stream)
+        if plan is None:
+            self.plan = None
+            yield from self.ydl.build_format_selector(self.fallback)(ctx)
+            return
+
+        plan['cpu_seconds'] = plan_cpu_seconds(plan, formats)
+        self.plan = plan
+        if self.on_plan is not None:
+            try:
+                self.on_plan(self.report())
+            except Exception as e:
+                logging.error(f"Format plan callback failed: {e}")
+        if len(plan['formats']) == 1:
+            yield plan['formats'][0]
+            return
+        # yt-dlp builds the merged format; the output container is read at merge time
+        self.ydl.params['merge_output_format'] = plan['merge_output_format']
+        yield from self.ydl.build_format_selector('bv*+ba')(
+            {'formats': plan['formats'], 'has_merged_format': False, 'incomplete_formats': False})
+
+    def report(self):
+        """The chosen plan as shown in the task status, or None."""
+        if self.plan is None:
+            return None
+        return {
+            'kind': self.plan['kind'],
+            'format_id': '+'.join(str(f.get('format_id')) for f in self.plan['formats']),
+            'steps': self.plan['steps'],
+            'cpu_seconds': self.plan['cpu_seconds'],
+        }
+
+    def postprocess_opts(self):
+        """Options for the post-processing stage of the chosen plan, or None without a plan."""
+        if self.plan is None:
+            return None
+        opts = {'postprocessors': self.plan['postprocessors']}
+        if self.plan['merge_output_format']:
+            opts['merge_output_format'] = self.plan['merge_output_format']
+        return opts
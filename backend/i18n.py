@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import string
+import threading
+import time
+from functools import lru_cache
+
+DEFAULT_LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend', 'locales')
+
+# Language tags that do not map onto a locale file by primary subtag alone
+LANGUAGE_ALIASES = {
+    'zh': 'zh-CN',
+    'zh-hans': 'zh-CN',
+    'zh-sg': 'zh-CN',
+    'zh-hant': 'zh-TW',
+    'zh-hk': 'zh-TW',
+    'zh-mo': 'zh-TW',
+    'tl': 'fil',
+}
+
+_formatter = string.Formatter()
+
+
+def compile_template(text):
+    """Pre-parse a str.format template into (literal, field, format_spec, conversion) parts.
+
+    Returns None for templates without replacement fields so they can be
+    returned as-is.
+    """
+    try:
+        parts = list(_formatter.parse(text))
+    except ValueError:
+        return None
+    if all(field is None for _, field, _, _ in parts):
+        return None
+    return parts
+
+
+def render_template(text, parts, kwargs):
+    if parts is None or not kwargs:
+        return text
+    try:
+        out = []
+        for literal, field, format_spec, conversion in parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = kwargs[field]
+            if conversion:
+                value = _formatter.convert_field(value, conversion)
+            out.append(format(value, format_spec or ''))
+        return ''.join(out)
+    except (KeyError, ValueError, TypeError):
+        # Same result str.format would give for a template it cannot fill
+        return text.format(**kwargs)
+
+
+def parse_accept_language(header):
+    """Return the language tags of an Accept-Language header, best first."""
+    ranges = []
+    for position, item in enumerate(header.split(',')):
+        tag, _, params = item.strip().partition(';')
+        tag = tag.strip()
+        if not tag or tag == '*':
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if quality > 0:
+            ranges.append((-quality, position, tag))
+    return [tag for _, _, tag in sorted(ranges)]
+
+
+class TranslationCatalog:
+    """All frontend locale files, loaded once and kept in memory.
+
+    Templates are pre-parsed at load time. The locale directory is re-checked
+    at most every check_interval seconds and reloaded only when a file's
+    mtime changed. Missing keys fall back to the default language, then to
+    the key itself.
+    """
+
+    def __init__(self, locales_dir=DEFAULT_LOCALES_DIR, default_lang='en', check_interval=5):
+        self.locales_dir = locales_dir
+        self.default_lang = default_lang
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._catalog = {}
+        self._lookup = {}
+        self._mtimes = {}
+        self._next_check = 0
+        self.negotiate = lru_cache(maxsize=1024)(self._negotiate)
+        self.reload()
+
+    def _scan(self):
+        try:
+            names = [name for name in os.listdir(self.locales_dir) if name.endswith('.json')]
+        except OSError as e:
+            logging.error(f"Could not list locale directory {self.locales_dir}: {e}")
+            return {}
+        mtimes = {}
+        for name in names:
+            try:
+                mtimes[name[:-5]] = os.stat(os.path.join(self.locales_dir, name)).st_mtime
+            except OSError:
+                pass
+        return mtimes
+
+    def reload(self):
+        mtimes = self._scan()
+        catalog = {}
+        for lang in mtimes:
+            try:
+                with open(os.path.join(self.locales_dir, f'{lang}.json'), 'r', encoding='utf-8') as f:
+                    translations = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.error(f"Could not load locale {lang}: {e}")
+                continue
+            catalog[lang] = {key: (text, compile_template(text)) for key, text in translations.items()
+                             if isinstance(text, str)}
+        with self._lock:
+            self._catalog = catalog
+            self._lookup = {lang.lower(): lang for lang in catalog}
+            self._mtimes = mtimes
+            self._next_check = time.monotonic() + self.check_interval
+        self.negotiate.cache_clear()
+        logging.info(f"Loaded {len(catalog)} locales from {self.locales_dir}")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+        if self._scan() != self._mtimes:
+            self.reload()
+
+    def translate(self, key, lang='en', **kwargs):
+        self._maybe_reload()
+        entry = self._catalog.get(lang, {}).get(key)
+        if entry is None:
+            entry = self._catalog.get(self.default_lang, {}).get(key)
+        if entry is None:
+            return key.format(**kwargs) if kwargs else key
+        text, parts = entry
+        return render_template(text, parts, kwargs)
+
+    def _negotiate(self, accept_language):
+        """Pick the best available locale for an Accept-Language header value."""
+        for tag in parse_accept_language(accept_language):
+            subtags = tag.lower().split('-')
+            # Most specific first: zh-Hant-HK -> zh-hant-hk, zh-hant, zh
+            prefixes = ['-'.join(subtags[:n]) for n in range(len(subtags), 0, -1)]
+            for prefix in prefixes:
+                for candidate in (prefix, LANGUAGE_ALIASES.get(prefix)):
+                    if candidate and candidate.lower() in self._lookup:
+                        return self._lookup[candidate.lower()]
+        return self.default_lang
@@ -0,0 +1,148 @@
+import contextlib
+import itertools
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import yt_dlp
+
+import postprocess_worker
+
+
+# --- Download stage: stop yt-dlp before any ffmpeg work ---
+class HandoffYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL that downloads the raw streams but defers post-processing.
+
+    Instead of running the merger/fixup postprocessors that process_info queued
+    for a file, post_process() records them in self.handoffs so the job can be
+    finished by PostprocessPool in a separate process. Each is recorded the way
+    the 'postprocessors' option describes one (key and keyword arguments),
+    taking the arguments from that option when it configures the same key.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.handoffs = []
+
+    def _postprocessor_def(self, pp):
+        key = type(pp).__name__[:-2]
+        for pp_def in self.params.get('postprocessors') or []:
+            if pp_def.get('key') == key:
+                return {k: v for k, v in pp_def.items() if k != 'when'}
+        return {'key': key}
+
+    def post_process(self, filename, info, files_to_move=None):
+        pending = [self._postprocessor_def(pp) for pp in info.get('__postprocessors') or []]
+        handoff_info = {k: v for k, v in info.items() if k != '__postprocessors'}
+        self.handoffs.append({
+            'filename': filename,
+            'info': self.sanitize_info(handoff_info),
+            'files_to_move': dict(files_to_move or {}),
+            'postprocessors': pending,
+        })
+        info['filepath'] = filename
+        return info
+
+
+# --- Post-processing stage (runs in the pool's child processes, see postprocess_worker.py) ---
+_main_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _worker_main():
+    """Start spawned children with postprocess_worker as their main module.
+
+    spawn re-imports the parent's __main__ in every child; for the server
+    that is app.py, which builds all of its services at import.
+    """
+    with _main_lock:
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = postprocess_worker
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main
+
+
+class PostprocessPool:
+    """CPU-bound stage of the download pipeline.
+
+    Merges, fixups and audio transcodes run in a process pool sized to the
+    number of cores, independent of the download worker pool. Postprocessor
+    hook events from the children are relayed through a queue to the
+    on_progress callback given at submit time, in the same shape yt-dlp
+    passes to postprocessor_hooks.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        # spawn: forking a multi-threaded Flask process is unsafe
+        self._context = multiprocessing.get_context('spawn')
+        self._progress_queue = self._context.Queue()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._job_ids = itertools.count(1)
+        self._pending = 0
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=self._context,
+            initializer=postprocess_worker.init_child, initargs=(self._progress_queue,))
+
+    def start(self):
+        self._executor = self._new_executor()
+        listener = threading.Thread(target=self._relay_progress, name='postprocess-progress')
+        listener.daemon = True
+        listener.start()
+        logging.info(f"Post-processing pool started with {self.workers} processes")
+
+    def _relay_progress(self):
+        while True:
+            job_id, event = self._progress_queue.get()
+            with self._lock:
+                on_progress = self._callbacks.get(job_id, (None, None))[0]
+            if on_progress:
+                try:
+                    on_progress(event)
+                except Exception as e:
+                    logging.error(f"Post-processing progress callback failed: {e}")
+
+    def submit(self, handoff, ydl_opts, on_progress, on_done):
+        """Queue a handoff recorded by HandoffYoutubeDL.
+
+        on_done(filepath, error) is called from a pool thread once the job has
+        finished; exactly one of filepath and error is set.
+        """
+        job_id = next(self._job_ids)
+        with self._lock:
+            self._callbacks[job_id] = (on_progress, on_done)
+            self._pending += 1
+        # The executor starts its children on submit
+        try:
+            with _worker_main():
+                future = self._executor.submit(postprocess_worker.run_postprocess, job_id, handoff, ydl_opts)
+        except BrokenProcessPool:
+            # A crashed child (e.g. OOM-killed ffmpeg) poisons the whole executor
+            logging.warning("Post-processing pool was broken, restarting it")
+            with self._lock:
+                self._executor = self._new_executor()
+            with _worker_main():
+                future = self._executor.submit(postprocess_worker.run_postprocess, job_id, handoff, ydl_opts)
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        return job_id
+
+    def _finish(self, job_id, future):
+        with self._lock:
+            on_done = self._callbacks.pop(job_id)[1]
+            self._pending -= 1
+        error = future.exception()
+        on_done(None if error else future.result(), error)
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'pending': self._pending}
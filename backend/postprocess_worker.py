@@ -0,0 +1,35 @@
+# Post-processing pool children (see postprocess_pool.py) start from this module
+# instead of the server's: it must import nothing but yt-dlp, never app.py
+import yt_dlp
+from yt_dlp.postprocessor import get_postprocessor
+
+_progress_queue = None
+
+
+def init_child(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def run_postprocess(job_id, handoff, ydl_opts):
+    """Run the deferred and configured postprocessors for one downloaded file."""
+
+    def forward_progress(d):
+        _progress_queue.put((job_id, {
+            'status': d.get('status'),
+            'postprocessor': d.get('postprocessor'),
+            'info_dict': {'filepath': (d.get('info_dict') or {}).get('filepath')},
+        }))
+
+    opts = dict(ydl_opts, quiet=True, noprogress=True, postprocessor_hooks=[forward_progress])
+    # Post-processing needs no extractors; skipping them saves ~80 ms per job
+    with yt_dlp.YoutubeDL(opts, auto_init=False) as ydl:
+        info = handoff['info']
+        # Rebuilt the way YoutubeDL builds its 'postprocessors' option: key + keyword arguments
+        pps = []
+        for pp_def in handoff['postprocessors']:
+            pp_def = dict(pp_def)
+            pps.append(get_postprocessor(pp_def.pop('key'))(ydl, **pp_def))
+        info['__postprocessors'] = pps
+        info = ydl.post_process(handoff['filename'], info, handoff['files_to_move'])
+    return info.get('filepath')
@@ -0,0 +1,87 @@
+import threading
+
+
+class ProgressBus:
+    """Publish/subscribe channel for task progress snapshots.
+
+    Every publish stores the task's latest snapshot, already serialized, under
+    a per-task event ID that increases by one per publish, or under the
+    event ID given by the publisher (the task store's change sequence when
+    several processes share it, so that a Last-Event-ID means the same in
+    every process; an older snapshot than the latest is dropped). Subscribers block
+    until the event ID moves past the one they last saw (wait in a thread,
+    or register an asyncio event with subscribe_async), so nothing polls and
+    a snapshot is serialized once no matter how many clients follow the task.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._conditions = {}
+        self._async_waiters = {}
+
+    def publish(self, task_id, payload, status=None, event_id=None):
+        """Record payload (a JSON string) as the latest snapshot of task_id.
+
+        Returns:
+            int: The event ID of the latest snapshot
+        """
+        with self._lock:
+            latest_id = self._latest.get(task_id, (0,))[0]
+            if event_id is None:
+                event_id = latest_id + 1
+            elif event_id <= latest_id:
+                return latest_id
+            self._latest[task_id] = (event_id, payload, status)
+            condition = self._conditions.get(task_id)
+            waiters = self._async_waiters.get(task_id)
+            waiters = list(waiters) if waiters else []
+        if condition is not None:
+            with condition:
+                condition.notify_all()
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+        return event_id
+
+    def latest(self, task_id):
+        """Return (event_id, payload, status) of the latest snapshot, or None."""
+        with self._lock:
+            return self._latest.get(task_id)
+
+    def wait(self, task_id, last_event_id=0, timeout=None):
+        """Block until task_id has an event newer than last_event_id.
+
+        Returns:
+            tuple: (event_id, payload, status), or None on timeout
+        """
+        with self._lock:
+            condition = self._conditions.setdefault(task_id, threading.Condition())
+        with condition:
+            condition.wait_for(lambda: self._newer(task_id, last_event_id), timeout)
+        return self._newer(task_id, last_event_id)
+
+    def _newer(self, task_id, last_event_id):
+        with self._lock:
+            latest = self._latest.get(task_id)
+        if latest and latest[0] > last_event_id:
+            return latest
+        return None
+
+    def subscribe_async(self, task_id, loop, event):
+        """Set the asyncio event (on its loop) whenever task_id publishes."""
+        with self._lock:
+            self._async_waiters.setdefault(task_id, set()).add((loop, event))
+
+    def unsubscribe_async(self, task_id, loop, event):
+        with self._lock:
+            waiters = self._async_waiters.get(task_id)
+            if waiters:
+                waiters.discard((loop, event))
+                if not waiters:
+                    del self._async_waiters[task_id]
+
+    def discard(self, task_id):
+        """Forget a task that has been evicted from the task store."""
+        with self._lock:
+            self._latest.pop(task_id, None)
+            self._conditions.pop(task_id, None)
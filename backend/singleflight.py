@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs fn(); callers that arrive while it is
+    still running block and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                is_leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                is_leader = True
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logging.info(f"Single-flight call for {key} shared with {call.waiters} waiting request(s)")
+            call.event.set()
+
+
+class SharedDownloads:
+    """Registry of download jobs shared by every task that asked for the same output.
+
+    A job is identified by a download key (canonical media ID plus the format
+    options). The first task for a key becomes the job leader and runs the
+    worker; later tasks subscribe to it. The finished file is reference counted
+    per subscribing task and handed back for deletion once every subscriber has
+    fetched it, or once the job has been complete for longer than ttl seconds.
+    """
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._jobs_by_key = {}
+        self._jobs_by_task = {}
+
+    def attach(self, key, task_id):
+        """Attach task_id to the job for key, creating the job if needed.
+
+        Returns:
+            tuple: (job dict snapshot, is_new) - is_new is True when task_id is
+            the leader and must start the worker
+        """
+        with self._lock:
+            job = self._jobs_by_key.get(key)
+            if job is None:
+                job = {
+                    'key': key,
+                    'leader': task_id,
+                    'subscribers': [task_id],
+                    'pending': {task_id},
+                    'state': 'running',
+                    'filepath': None,
+                    'completed_at': None,
+                }
+                self._jobs_by_key[key] = job
+                self._jobs_by_task[task_id] = job
+                return dict(job), True
+            job['subscribers'].append(task_id)
+            job['pending'].add(task_id)
+            self._jobs_by_task[task_id] = job
+            logging.info(f"Task {task_id} attached to running download job {job['leader']} ({len(job['subscribers'])} subscribers)")
+            return dict(job), False
+
+    def subscribers(self, task_id):
+        """Return every task ID that should receive progress written for task_id."""
+        with self._lock:
+            job = self._jobs_by_task.get(task_id)
+            if job is None or job['leader'] != task_id:
+                return [task_id]
+            return list(job['subscribers'])
+
+    def finish(self, leader_task_id, filepath):
+        with self._lock:
+            job = self._jobs_by_task.get(leader_task_id)
+            if job is None:
+                return
+            job['state'] = 'complete'
+            job['filepath'] = filepath
+            job['completed_at'] = time.time()
+
+    def fail(self, leader_task_id):
+        """Drop a failed job so that the next identical request starts afresh."""
+        with self._lock:
+            job = self._jobs_by_task.get(leader_task_id)
+            if job is None:
+                return
+            self._forget(job)
+
+    def _forget(self, job):
+        if self._jobs_by_key.get(job['key']) is job:
+            del self._jobs_by_key[job['key']]
+        for task_id in job['subscribers']:
+            if self._jobs_by_task.get(task_id) is job:
+                del self._jobs_by_task[task_id]
+
+    def release(self, task_id):
+        """Record that task_id has fetched its file.
+
+        Returns:
+            str: Path of the shared file if this was the last reference and it
+            should now be deleted, otherwise None
+        """
+        with self._lock:
+            job = self._jobs_by_task.get(task_id)
+            if job is None or job['state'] != 'complete':
+                return None
+            job['pending'].discard(task_id)
+            if job['pending']:
+                return None
+            self._forget(job)
+            return job['filepath']
+
+    def expire(self):
+        """Forget jobs whose file has outlived ttl and return their file paths."""
+        cutoff = time.time() - self.ttl
+        expired_paths = []
+        with self._lock:
+            for job in list(self._jobs_by_key.values()):
+                if job['state'] == 'complete' and job['completed_at'] < cutoff:
+                    self._forget(job)
+                    if job['filepath']:
+                        expired_paths.append(job['filepath'])
+        return expired_paths
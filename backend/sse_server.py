@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import re
+import threading
+
+STREAM_PATH = re.compile(r'^/api/stream-progress/([A-Za-z0-9_-]+)$')
+FINAL_STATUSES = ('complete', 'error')
+
+
+class SSEServer:
+    """Serves /api/stream-progress from a single asyncio thread.
+
+    Each open EventSource costs a coroutine and a socket instead of a Flask
+    worker thread, so thousands of idle progress streams stay cheap. Events
+    come from the ProgressBus; a comment line is sent every heartbeat seconds
+    to keep proxies from closing idle streams, and a reconnecting client's
+    Last-Event-ID header suppresses a snapshot it has already seen.
+
+    With reuse_port, every server process binds the same port (SO_REUSEPORT)
+    and the kernel spreads connections across them; any process can serve
+    any task once task state is shared between processes. on_connect(task_id)
+    is called (in a thread) before a stream starts, to publish a snapshot the
+    bus may not have yet.
+    """
+
+    def __init__(self, bus, host='127.0.0.1', port=5001, heartbeat=15, allowed_origin='*', reuse_port=False,
+                 on_connect=None):
+        self.bus = bus
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.on_connect = on_connect
+        self.heartbeat = heartbeat
+        self.allowed_origin = allowed_origin
+        self.connections = 0
+        self.loop = None
+        # Set once the port is bound; until then clients stay on the Flask route
+        self.running = False
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name='sse-server')
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            server = self.loop.run_until_complete(asyncio.start_server(
+                self._handle, self.host, self.port, reuse_port=self.reuse_port or None))
+        except OSError as e:
+            logging.error(f"SSE progress server could not listen on {self.host}:{self.port}: {e}")
+            return
+        self.running = True
+        logging.info(f"SSE progress server listening on {self.host}:{self.port}")
+        try:
+            self.loop.run_forever()
+        finally:
+            server.close()
+
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        parts = request_line.split(' ')
+        method = parts[0] if parts else ''
+        path = parts[1].split('?', 1)[0] if len(parts) > 1 else ''
+        return method, path, headers
+
+    async def _handle(self, reader, writer):
+        try:
+            method, path, headers = await asyncio.wait_for(self._read_request(reader), timeout=10)
+            match = STREAM_PATH.match(path)
+            if method != 'GET' or not match:
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                await writer.drain()
+                return
+            try:
+                last_event_id = int(headers.get('last-event-id', '0'))
+            except ValueError:
+                last_event_id = 0
+            writer.write((
+                'HTTP/1.1 200 OK\r\n'
+                'Content-Type: text/event-stream\r\n'
+                'Cache-Control: no-cache\r\n'
+                'X-Accel-Buffering: no\r\n'
+                f'Access-Control-Allow-Origin: {self.allowed_origin}\r\n'
+                'Connection: close\r\n\r\n'
+            ).encode('latin-1'))
+            await writer.drain()
+            self.connections += 1
+            try:
+                await self._stream(match.group(1), last_event_id, writer)
+            finally:
+                self.connections -= 1
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        except Exception:
+            logging.exception("SSE connection failed")
+        finally:
+            writer.close()
+
+    async def _stream(self, task_id, last_event_id, writer):
+        event = asyncio.Event()
+        self.bus.subscribe_async(task_id, self.loop, event)
+        try:
+            if self.on_connect:
+                await self.loop.run_in_executor(None, self.on_connect, task_id)
+            if self.bus.latest(task_id) is None:
+                writer.write(b'data: {}\n\n')
+            while True:
+                latest = self.bus.latest(task_id)
+                if latest and latest[0] > last_event_id:
+                    last_event_id, payload, status = latest
+                    writer.write(f'id: {last_event_id}\ndata: {payload}\n\n'.encode('utf-8'))
+                    await writer.drain()
+                    if status in FINAL_STATUSES:
+                        return
+                    continue
+                if latest and latest[2] in FINAL_STATUSES:
+                    return  # resumed after the final event was already delivered
+                event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    writer.write(b': keep-alive\n\n')
+                    await writer.drain()
+        finally:
+            self.bus.unsubscribe_async(task_id, self.loop, event)
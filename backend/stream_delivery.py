@@ -0,0 +1,177 @@
+import mimetypes
+import os
+import threading
+import time
+import unicodedata
+from urllib.parse import quote
+
+from yt_dlp.networking import Request
+
+CHUNK_SIZE = 256 * 1024
+STREAMABLE_PROTOCOLS = ('http', 'https')
+
+
+def is_streamable(info, media_type, format_type):
+    """Whether the format yt-dlp selected can be sent to the client while it downloads.
+
+    Only a single progressive HTTP download qualifies: a merge of separate
+    video/audio streams or an audio transcode can only start once the whole
+    input is on disk, and fragmented (HLS/DASH) downloads need a fixup pass.
+
+    Args:
+        info: Info dict returned by extract_info(download=False)
+        media_type: 'video' or 'audio'
+        format_type: Requested container/codec (e.g. 'mp4', 'm4a')
+
+    Returns:
+        bool: True if the selected format needs no post-processing
+    """
+    if info.get('_type', 'video') != 'video' or info.get('requested_formats'):
+        return False
+    if info.get('protocol') not in STREAMABLE_PROTOCOLS:
+        return False
+    if media_type == 'audio':
+        return info.get('ext') == format_type
+    return info.get('acodec') != 'none'
+
+
+def attachment_headers(download_name):
+    """Content-Type and Content-Disposition headers for an attachment, as send_file builds them."""
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    try:
+        download_name.encode('ascii')
+        disposition = f'attachment; filename="{download_name}"'
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+^`|~")
+        disposition = f'attachment; filename="{simple}"; filename*=UTF-8\'\'{quoted}'
+    return {'Content-Type': mimetype, 'Content-Disposition': disposition}
+
+
+def tail_file(path, is_finished, chunk_size=CHUNK_SIZE, poll_interval=0.2, wait_timeout=30):
+    """Yield the contents of a file that the downloader is still writing.
+
+    Reads only as fast as the client consumes the response. At end of file the
+    generator sleeps poll_interval seconds and reads again, until
+    is_finished() reports that the writer is done and the remaining bytes
+    have been sent.
+
+    Args:
+        path: File being written (a yt-dlp download with nopart)
+        is_finished: Callable returning None while the download runs, True
+            when it completed and False when it failed
+        wait_timeout: Seconds to wait for the file to appear
+
+    Raises:
+        IOError: If the download failed, so the server aborts the response
+            instead of ending it as if the file were complete
+    """
+    deadline = time.monotonic() + wait_timeout
+    while not os.path.exists(path):
+        if is_finished() is False or time.monotonic() > deadline:
+            raise IOError(f"Streamed file did not appear: {path}")
+        time.sleep(poll_interval)
+
+    with open(path, 'rb') as f:
+        finished = None
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                yield chunk
+                continue
+            if finished:
+                return  # writer was done before this read, so this EOF is final
+            finished = is_finished()
+            if finished is False:
+                raise IOError(f"Download failed while streaming {path}")
+            if finished is None:
+                time.sleep(poll_interval)
+
+
+def open_upstream(ydl, fmt):
+    """Open the selected format's URL with the downloader's proxy, headers and cookies."""
+    return ydl.urlopen(Request(fmt['url'], headers=fmt.get('http_headers') or {}))
+
+
+def relay_upstream(response, on_chunk=None, chunk_size=CHUNK_SIZE):
+    """Yield an upstream response body chunk by chunk without writing it to disk.
+
+    The next chunk is only read from upstream after the client has taken the
+    previous one, so a slow client slows the transfer instead of buffering it.
+    on_chunk(downloaded_bytes) is called after each chunk.
+    """
+    downloaded = 0
+    try:
+        while True:
+            chunk = response.read(chunk_size)
+            if not chunk:
+                return
+            downloaded += len(chunk)
+            yield chunk
+            if on_chunk:
+                on_chunk(downloaded)
+    finally:
+        response.close()
+
+
+class PipeSources:
+    """Resolved formats of tasks that are delivered without being saved (persist=false).
+
+    The download worker only extracts and selects the format; the transfer
+    itself runs when the client requests the file, piping the upstream body
+    straight into the response. Sources are kept in this process until they
+    are delivered or their signed URL expires.
+    """
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sources = {}
+
+    def add(self, task_id, fmt, ydl_opts, cookies, download_name, expires_at=None, meta=None):
+        """Register the format selected for task_id.
+
+        Args:
+            fmt: Selected format (url, http_headers, filesize, ...)
+            ydl_opts: Options (proxy, headers) to open the URL with
+            cookies: Cookies set during extraction
+            download_name: File name offered to the client
+            expires_at: Signed URL expiry; the source is dropped at the
+                earlier of this and ttl seconds from now
+            meta: Opaque value handed back by expire()
+        """
+        deadline = time.time() + self.ttl
+        if expires_at:
+            deadline = min(deadline, expires_at)
+        with self._lock:
+            self._sources[task_id] = {
+                'format': fmt,
+                'ydl_opts': ydl_opts,
+                'cookies': list(cookies),
+                'download_name': download_name,
+                'expires_at': deadline,
+                'meta': meta,
+            }
+
+    def get(self, task_id):
+        with self._lock:
+            return self._sources.get(task_id)
+
+    def discard(self, task_id):
+        with self._lock:
+            self._sources.pop(task_id, None)
+
+    def expire(self):
+        """Forget sources that can no longer be fetched.
+
+        Returns:
+            list: (task_id, meta) of every expired source
+        """
+        now = time.time()
+        with self._lock:
+            expired = [task_id for task_id, source in self._sources.items() if source['expires_at'] < now]
+            return [(task_id, self._sources.pop(task_id)['meta']) for task_id in expired]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sources)
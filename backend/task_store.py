@@ -0,0 +1,321 @@
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+
+FINISHED_STATUSES = ('complete', 'error')
+
+
+def render_task(task):
+    """Public view of a stored task: 'updated_at' becomes the ISO 'timestamp' field."""
+    view = dict(task)
+    updated_at = view.pop('updated_at', None)
+    if updated_at is not None:
+        view['timestamp'] = datetime.fromtimestamp(updated_at).isoformat()
+    return view
+
+
+class TaskStore:
+    """Interface shared by the task store backends.
+
+    Tasks are plain JSON-serializable dicts. get/create/update return the
+    public view produced by render_task.
+    """
+
+    # True when several server processes share the stored tasks
+    multiprocess = False
+
+    def create(self, task_id, fields):
+        raise NotImplementedError
+
+    def get(self, task_id):
+        raise NotImplementedError
+
+    def update(self, task_id, fields, remove=(), if_status=None):
+        raise NotImplementedError
+
+    def delete(self, task_id):
+        raise NotImplementedError
+
+    def count_by_status(self):
+        raise NotImplementedError
+
+    def evict(self, ttl):
+        """Delete finished or errored tasks idle for more than ttl seconds; return their IDs."""
+        raise NotImplementedError
+
+    def watch(self, callback):
+        """Call callback(task_id, task) for changes written by other processes.
+
+        Single-process backends have nothing to watch.
+        """
+
+    def shared_secret(self, name):
+        """A random secret created on first use and the same in every process
+        sharing the store; None for single-process backends."""
+        return None
+
+
+class InMemoryTaskStore(TaskStore):
+    """Task state split across independently locked shards.
+
+    Writers for different tasks rarely contend: each task hashes to one of
+    `shards` dicts with its own lock, instead of every progress tick taking
+    one global lock. Stored tasks keep their last write time as a float
+    ('updated_at'); the ISO timestamp is only formatted when a task is read.
+    """
+
+    def __init__(self, shards=64):
+        self._shards = [(threading.Lock(), {}) for _ in range(shards)]
+
+    def _shard(self, task_id):
+        return self._shards[zlib.crc32(task_id.encode('utf-8')) % len(self._shards)]
+
+    def create(self, task_id, fields):
+        lock, shard = self._shard(task_id)
+        task = dict(fields, updated_at=time.time())
+        with lock:
+            shard[task_id] = task
+        return render_task(task)
+
+    def get(self, task_id):
+        """Return a copy of the task, or None if it does not exist."""
+        lock, shard = self._shard(task_id)
+        with lock:
+            task = shard.get(task_id)
+            return render_task(task) if task is not None else None
+
+    def update(self, task_id, fields, remove=(), if_status=None):
+        """Merge fields into the task (creating it if needed).
+
+        Args:
+            task_id: The task to update
+            fields: Values to set
+            remove: Field names to delete
+            if_status: Only update when the task's current status equals this
+
+        Returns:
+            tuple: (updated task copy or None if skipped, True if the status changed)
+        """
+        lock, shard = self._shard(task_id)
+        with lock:
+            task = shard.get(task_id)
+            if if_status is not None and (task is None or task.get('status') != if_status):
+                return None, False
+            if task is None:
+                task = shard[task_id] = {}
+            previous_status = task.get('status')
+            task.update(fields)
+            for name in remove:
+                task.pop(name, None)
+            task['updated_at'] = time.time()
+            return render_task(task), task.get('status') != previous_status
+
+    def delete(self, task_id):
+        lock, shard = self._shard(task_id)
+        with lock:
+            shard.pop(task_id, None)
+
+    def count_by_status(self):
+        counts = {}
+        for lock, shard in self._shards:
+            with lock:
+                for task in shard.values():
+                    status = task.get('status', 'unknown')
+                    counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def evict(self, ttl):
+        cutoff = time.time() - ttl
+        evicted = []
+        for lock, shard in self._shards:
+            with lock:
+                for task_id, task in list(shard.items()):
+                    if task.get('status') in FINISHED_STATUSES and task['updated_at'] < cutoff:
+                        del shard[task_id]
+                        evicted.append(task_id)
+        return evicted
+
+
+class SQLiteTaskStore(TaskStore):
+    """Task state in a SQLite database (WAL mode) shared by every process on the host.
+
+    Each write bumps a database-wide sequence number and records the writing
+    process. watch() starts a thread that notices commits from other
+    processes through PRAGMA data_version and reports the changed tasks, so
+    progress streams work whichever process serves them. Task views carry the
+    sequence number of their last write as 'seq', the same in every process.
+    """
+
+    multiprocess = True
+
+    def __init__(self, path, poll_interval=0.2):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tasks ('
+                ' task_id TEXT PRIMARY KEY, data TEXT NOT NULL, status TEXT,'
+                ' updated_at REAL NOT NULL, seq INTEGER NOT NULL, writer INTEGER NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS tasks_seq ON tasks (seq)')
+            # Monotonic change counter; MAX(seq) would go backwards when tasks are deleted
+            conn.execute('CREATE TABLE IF NOT EXISTS task_seq (id INTEGER PRIMARY KEY CHECK (id = 1), value INTEGER NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO task_seq (id, value) VALUES (1, 0)')
+            conn.execute('CREATE INDEX IF NOT EXISTS tasks_status_updated ON tasks (status, updated_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS secrets (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _conn(self):
+        # sqlite3 connections may not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _write(self, conn, task_id, task):
+        """Store task under the next change sequence number and return that number.
+        Caller holds a write transaction."""
+        task.pop('seq', None)  # a view passed back in
+        conn.execute('UPDATE task_seq SET value = value + 1 WHERE id = 1')
+        seq = conn.execute('SELECT value FROM task_seq WHERE id = 1').fetchone()[0]
+        conn.execute(
+            'INSERT OR REPLACE INTO tasks (task_id, data, status, updated_at, seq, writer) VALUES (?, ?, ?, ?, ?, ?)',
+            (task_id, json.dumps(task), task.get('status'), task['updated_at'], seq, os.getpid()))
+        return seq
+
+    @staticmethod
+    def _view(task, seq):
+        return dict(render_task(task), seq=seq)
+
+    def create(self, task_id, fields):
+        task = dict(fields, updated_at=time.time())
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            seq = self._write(conn, task_id, task)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return self._view(task, seq)
+
+    def get(self, task_id):
+        row = self._conn().execute('SELECT data, seq FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+        return self._view(json.loads(row[0]), row[1]) if row else None
+
+    def update(self, task_id, fields, remove=(), if_status=None):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT data FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+            task = json.loads(row[0]) if row else None
+            if if_status is not None and (task is None or task.get('status') != if_status):
+                conn.execute('ROLLBACK')
+                return None, False
+            task = task or {}
+            previous_status = task.get('status')
+            task.update(fields)
+            for name in remove:
+                task.pop(name, None)
+            task['updated_at'] = time.time()
+            seq = self._write(conn, task_id, task)
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        return self._view(task, seq), task.get('status') != previous_status
+
+    def delete(self, task_id):
+        self._conn().execute('DELETE FROM tasks WHERE task_id = ?', (task_id,))
+
+    def shared_secret(self, name):
+        conn = self._conn()
+        # The first process to ask creates it; the others read the same row
+        conn.execute('INSERT OR IGNORE INTO secrets (name, value) VALUES (?, ?)', (name, secrets.token_hex(32)))
+        return conn.execute('SELECT value FROM secrets WHERE name = ?', (name,)).fetchone()[0]
+
+    def count_by_status(self):
+        rows = self._conn().execute('SELECT COALESCE(status, ?), COUNT(*) FROM tasks GROUP BY status', ('unknown',))
+        return dict(rows.fetchall())
+
+    def evict(self, ttl):
+        cutoff = time.time() - ttl
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            placeholders = ', '.join('?' * len(FINISHED_STATUSES))
+            where = f'status IN ({placeholders}) AND updated_at < ?'
+            params = (*FINISHED_STATUSES, cutoff)
+            evicted = [row[0] for row in conn.execute(f'SELECT task_id FROM tasks WHERE {where}', params)]
+            conn.execute(f'DELETE FROM tasks WHERE {where}', params)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return evicted
+
+    def watch(self, callback):
+        thread = threading.Thread(target=self._watch_loop, args=(callback,), name='task-store-watch')
+        thread.daemon = True
+        thread.start()
+
+    def _watch_loop(self, callback):
+        conn = self._connect()
+        pid = os.getpid()
+        last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM tasks').fetchone()[0]
+        data_version = None
+        while True:
+            try:
+                current_version = conn.execute('PRAGMA data_version').fetchone()[0]
+                if current_version != data_version:
+                    data_version = current_version
+                    rows = conn.execute(
+                        'SELECT task_id, data, seq, writer FROM tasks WHERE seq > ? ORDER BY seq',
+                        (last_seq,)).fetchall()
+                    for task_id, data, seq, writer in rows:
+                        last_seq = seq
+                        if writer != pid:
+                            callback(task_id, self._view(json.loads(data), seq))
+            except Exception as e:
+                logging.error(f"Task store watcher failed: {e}")
+            time.sleep(self.poll_interval)
+
+
+class ProgressThrottle:
+    """Decides which download progress ticks are worth writing.
+
+    The first tick is always written (it is a status transition); after that
+    a tick is written once the percentage moved by min_delta or min_interval
+    seconds passed since the last written tick.
+    """
+
+    def __init__(self, min_delta=1.0, min_interval=0.5):
+        self.min_delta = min_delta
+        self.min_interval = min_interval
+        self._last_percentage = None
+        self._last_time = 0.0
+
+    def should_emit(self, percentage=None):
+        """percentage may be None when the tick carried no parsable percentage."""
+        now = time.monotonic()
+        if (not self._last_time
+                or now - self._last_time >= self.min_interval
+                or (percentage is not None and self._last_percentage is not None
+                    and abs(percentage - self._last_percentage) >= self.min_delta)):
+            if percentage is not None:
+                self._last_percentage = percentage
+            self._last_time = now
+            return True
+        return False
@@ -0,0 +1,18 @@
+import json
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(BACKEND_DIR, 'tests', 'fixtures')
+
+# Backend modules are imported by name, as app.py does
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope='session')
+def recorded_formats():
+    """Format lists recorded from yt-dlp extractions (worst to best, as yt-dlp sorts them)."""
+    with open(os.path.join(FIXTURES_DIR, 'formats.json'), encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+
+import pytest
+
+from analysis_response import append_field, audio_rung, compact_media_info, parse_fields, select_fields, video_rung
+
+VIDEO_URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+
+@pytest.mark.parametrize('value, fields', [
+    ('', None),
+    (None, None),
+    ('title', {'title': None}),
+    ('title, duration,', {'title': None, 'duration': None}),
+    ('video_formats(height,fps),title', {'video_formats': ('height', 'fps'), 'title': None}),
+    ('video_formats(height, height)', {'video_formats': ('height',)}),
+    ('video_formats()', {'video_formats': None}),
+])
+def test_parse_fields(value, fields):
+    assert parse_fields(value) == fields
+
+
+@pytest.mark.parametrize('value', [
+    'video_formats(height,(fps))',
+    'video_formats((height))',
+    'video_formats(height',
+    'video_formats height)',
+    'title)(',
+])
+def test_parse_fields_rejects_nested_or_unbalanced_parentheses(value):
+    with pytest.raises(ValueError):
+        parse_fields(value)
+
+
+def test_select_fields_skips_unknown_fields_and_keys():
+    media_info = {'title': 'T', 'video_formats': [{'height': 720, 'fps': 30}, {'height': 480}]}
+    selected = select_fields(media_info, parse_fields('title,video_formats(height,fps),missing'))
+    assert selected == {'title': 'T', 'video_formats': [{'height': 720, 'fps': 30}, {'height': 480}]}
+
+
+@pytest.mark.parametrize('body, expected', [
+    (b'{}', {'analysis_token': 'tok'}),
+    (b'{"title":"T"}', {'title': 'T', 'analysis_token': 'tok'}),
+])
+def test_append_field(body, expected):
+    assert json.loads(append_field(body, 'analysis_token', 'tok')) == expected
+
+
+@pytest.fixture(scope='module')
+def app_module():
+    os.environ.setdefault('TEMP_DIR', tempfile.mkdtemp(prefix='hqmx-test-'))
+    os.environ['SSE_PORT'] = '0'
+    import app
+    return app
+
+
+def test_compact_keeps_the_entry_the_full_response_lists_first(app_module, recorded_formats):
+    media_info = app_module.extract_media_info({'title': 'T', 'formats': recorded_formats['youtube']})
+    compact = compact_media_info(media_info)
+    assert '_compact' not in compact
+    for name, rung in (('video_formats', video_rung), ('audio_formats', audio_rung)):
+        firsts = {}
+        for f in media_info[name]:
+            firsts.setdefault(rung(f), f['format_id'])
+        assert [f['format_id'] for f in compact[name]] == list(firsts.values())
+    # Analyses stored before the ladder was kept are filtered the same way
+    stored = {key: value for key, value in media_info.items() if key != '_compact'}
+    assert compact_media_info(stored) == compact
+
+
+def test_analyze_etag_and_not_modified(app_module, recorded_formats):
+    media_info = app_module.extract_media_info({'title': 'T', 'formats': recorded_formats['youtube']})
+    app_module.analysis_cache.set(app_module.canonical_media_id(app_module.convert_https_to_http(VIDEO_URL)), media_info)
+    client = app_module.app.test_client()
+
+    full = client.get('/api/analyze', query_string={'url': VIDEO_URL})
+    assert full.status_code == 200
+    assert '_compact' not in full.json
+    etag = full.headers['ETag']
+
+    repeat = client.get('/api/analyze', query_string={'url': VIDEO_URL}, headers={'If-None-Match': etag})
+    assert repeat.status_code == 304
+    assert repeat.data == b''
+
+    # Each variant has its own entity tag
+    compact = client.get('/api/analyze', query_string={'url': VIDEO_URL, 'compact': '1'},
+                         headers={'If-None-Match': etag})
+    assert compact.status_code == 200
+    assert compact.headers['ETag'] != etag
+
+    bad = client.get('/api/analyze', query_string={'url': VIDEO_URL, 'fields': 'video_formats((height))'})
+    assert bad.status_code == 400
+
+
+def test_repeated_format_id_keeps_first_position_and_last_values(app_module):
+    formats = [
+        {'format_id': 'a', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'tbr': 1},
+        {'format_id': 'b', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'tbr': 2},
+        {'format_id': 'a', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'tbr': 3},
+    ]
+    media_info = app_module.extract_media_info({'title': 'T', 'formats': formats})
+    assert [(f['format_id'], f['tbr']) for f in media_info['video_formats']] == [('a', 3), ('b', 2)]
@@ -0,0 +1,49 @@
+import multiprocessing
+import os
+
+from artifact_store import ArtifactStore
+
+
+def hold(root, path, acquired, done):
+    store = ArtifactStore(root, quota_bytes=100)
+    if store.acquire(path):
+        acquired.set()
+    done.wait(10)
+
+
+def test_stores_on_the_same_root_share_index_refs_and_quota(tmp_path):
+    root = str(tmp_path)
+    a_dir, b_dir = str(tmp_path / 'a'), str(tmp_path / 'b')
+    os.mkdir(a_dir)
+    os.mkdir(b_dir)
+    first, second = ArtifactStore(root, quota_bytes=100), ArtifactStore(root, quota_bytes=100)
+    first.load()
+    second.load()
+    first.add(a_dir, 'a', size=60)
+    assert a_dir in second
+    assert second.stats()['used_bytes'] == 60
+
+    context = multiprocessing.get_context('fork')
+    acquired, done = context.Event(), context.Event()
+    child = context.Process(target=hold, args=(root, a_dir, acquired, done))
+    child.start()
+    try:
+        assert acquired.wait(10)
+        # Over the shared quota, but the file another process is sending is neither evicted nor swept
+        second.add(b_dir, 'b', size=60)
+        assert os.path.isdir(a_dir)
+        assert first.stats()['used_bytes'] == 120
+        first.delete_soon(a_dir, delay=0)
+        second.sweep()
+        assert os.path.isdir(a_dir)
+    finally:
+        done.set()
+        child.join()
+
+    # The child exited without releasing: its ref no longer protects the file
+    second.sweep()
+    assert not os.path.isdir(a_dir)
+    assert a_dir not in first
+    assert first.stats()['used_bytes'] == 60
+    # A restarted process sees the same index
+    assert ArtifactStore(root, quota_bytes=100).stats()['files'] == 1
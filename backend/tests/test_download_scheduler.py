@@ -0,0 +1,54 @@
+import threading
+import time
+
+from download_scheduler import DownloadScheduler
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_timed_out_job_gives_its_worker_back():
+    hang = threading.Event()
+    ran = threading.Event()
+    timeouts = []
+    scheduler = DownloadScheduler(workers=1, job_timeout=0.2,
+                                  on_timeout=lambda task_id, meta: timeouts.append(task_id))
+    scheduler.start()
+    scheduler.submit('hung', hang.wait)
+    scheduler.submit('next', ran.set)
+    assert ran.wait(5)
+    assert timeouts == ['hung']
+    assert scheduler.timed_out('hung')
+    assert scheduler.stats()['timed_out'] == 1
+
+    # The hung job's thread exits instead of taking more work
+    hang.set()
+    wait_for(lambda: not scheduler.timed_out('hung'))
+    wait_for(lambda: scheduler.stats()['running'] == 0)
+    assert scheduler.stats()['completed'] == 1
+
+
+def test_queue_positions_are_published_at_reporting_steps():
+    published = []
+    block = threading.Event()
+    scheduler = DownloadScheduler(workers=1, max_queue=100, exact_positions=3, position_step=5,
+                                  on_queue_change=lambda task_id, position, meta: published.append((task_id, position)))
+    scheduler.start()
+    scheduler.submit('running', block.wait)
+    wait_for(lambda: scheduler.stats()['running'] == 1)
+    for i in range(12):
+        scheduler.submit(f'job-{i}', lambda: None)
+    published.clear()
+
+    # Dispatching the head moves every job up one place: only the ones crossing a step hear about it
+    block.set()
+    wait_for(lambda: scheduler.stats()['queued'] == 0)
+    first_dispatch = published[:published.index(('job-1', None))]
+    assert ('job-0', None) in first_dispatch
+    moved = dict(first_dispatch)
+    assert moved['job-1'] == 1 and moved['job-2'] == 2 and moved['job-3'] == 3
+    assert 'job-4' not in moved and moved['job-7'] == 7 and 'job-8' not in moved
@@ -0,0 +1,156 @@
+import pytest
+import yt_dlp
+
+from format_planner import DIRECT, REMUX, TRANSCODE, FormatPlanner, copyable, plan_audio, plan_video
+
+
+def format_ids(plan):
+    return [f['format_id'] for f in plan['formats']]
+
+
+@pytest.mark.parametrize('source, container, max_height, max_fps, kind, ids', [
+    # Best rung that needs no re-encode: H.264 1080p60 + AAC merged by stream copy
+    ('youtube', 'mp4', None, None, REMUX, ['299', '140']),
+    ('youtube', 'mov', None, None, REMUX, ['299', '140']),
+    ('youtube', 'webm', None, None, REMUX, ['315', '251']),
+    ('youtube', 'mkv', None, None, REMUX, ['315', '251']),
+    ('youtube', 'mp4', 720, None, REMUX, ['298', '140']),
+    ('youtube', 'mp4', 1080, 30, REMUX, ['137', '140']),
+    ('youtube', 'webm', 480, None, REMUX, ['244', '251']),
+    # The progressive file wins over a merge at the same rung
+    ('youtube', 'mp4', 360, None, DIRECT, ['18']),
+    # mp4 takes neither VP9 nor Opus: the VP9 rungs above 360p are dropped for
+    # the best copyable one instead of being transcoded
+    ('youtube_vp9_opus', 'mp4', None, None, DIRECT, ['18']),
+    ('youtube_vp9_opus', 'webm', None, None, REMUX, ['248', '251']),
+    # Unknown codecs (generic extractor) are delivered as they are
+    ('generic_mp4', 'mp4', None, None, DIRECT, ['mp4']),
+    ('generic_mp4', 'webm', None, None, DIRECT, ['mp4']),
+])
+def test_plan_video(recorded_formats, source, container, max_height, max_fps, kind, ids):
+    plan = plan_video(recorded_formats[source], container, max_height, max_fps)
+    assert plan['kind'] == kind
+    assert format_ids(plan) == ids
+    assert plan['kind'] != TRANSCODE or plan['postprocessors'][0]['key'] == 'FFmpegVideoConvertor'
+
+
+def test_plan_video_transcodes_only_without_copyable_rung():
+    formats = [
+        {'format_id': 'a', 'ext': 'webm', 'vcodec': 'none', 'acodec': 'opus', 'abr': 130},
+        {'format_id': 'v', 'ext': 'webm', 'vcodec': 'vp9', 'acodec': 'none', 'height': 720, 'fps': 30},
+    ]
+    plan = plan_video(formats, 'mp4')
+    assert plan['kind'] == TRANSCODE
+    assert format_ids(plan) == ['v', 'a']
+    assert plan['merge_output_format'] == 'mkv'
+    assert plan['postprocessors'] == [{'key': 'FFmpegVideoConvertor', 'preferedformat': 'mp4'}]
+
+
+def test_plan_video_stream_prefers_direct_at_the_same_height(recorded_formats):
+    formats = [
+        {'format_id': 'a', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128},
+        {'format_id': 'p', 'ext': 'mp4', 'vcodec': 'avc1.4d401f', 'acodec': 'mp4a.40.2', 'height': 720, 'fps': 30},
+        {'format_id': 'v', 'ext': 'mp4', 'vcodec': 'avc1.4d4020', 'acodec': 'none', 'height': 720, 'fps': 60},
+    ]
+    assert format_ids(plan_video(formats, 'mp4')) == ['v', 'a']
+    plan = plan_video(formats, 'mp4', stream=True)
+    assert plan['kind'] == DIRECT
+    assert format_ids(plan) == ['p']
+    # A direct file at a lower height does not win over the requested rung
+    plan = plan_video(recorded_formats['youtube'], 'mp4', 720, stream=True)
+    assert plan['kind'] == REMUX
+    assert format_ids(plan) == ['298', '140']
+
+
+def test_plan_video_without_video_formats():
+    assert plan_video([{'format_id': 'a', 'vcodec': 'none', 'acodec': 'opus'}], 'mp4') is None
+
+
+@pytest.mark.parametrize('source, codec, bitrate, kind, ids', [
+    ('youtube', 'm4a', 128, DIRECT, ['140']),
+    ('youtube', 'm4a', None, DIRECT, ['140']),
+    ('youtube', 'opus', None, REMUX, ['251']),
+    ('youtube', 'mp3', 192, TRANSCODE, ['251']),
+    # A 48 kbps AAC stream is not copied for a 128 kbps m4a request
+    ('youtube_vp9_opus', 'm4a', 128, TRANSCODE, ['251']),
+    ('generic_mp4', 'mp3', 192, TRANSCODE, ['mp4']),
+])
+def test_plan_audio(recorded_formats, source, codec, bitrate, kind, ids):
+    plan = plan_audio(recorded_formats[source], codec, bitrate, '5')
+    assert plan['kind'] == kind
+    assert format_ids(plan) == ids
+    if kind == DIRECT:
+        assert plan['postprocessors'] == []
+    else:
+        assert plan['postprocessors'][0] == {'key': 'FFmpegExtractAudio', 'preferredcodec': codec,
+                                             'preferredquality': '5'}
+
+
+def test_plan_audio_stream_takes_the_requested_codec_at_any_bitrate(recorded_formats):
+    plan = plan_audio(recorded_formats['youtube_vp9_opus'], 'm4a', 128, '5', stream=True)
+    assert plan['kind'] == DIRECT
+    assert format_ids(plan) == ['139']
+
+
+@pytest.mark.parametrize('container, codecs, expected', [
+    ('mp4', ('avc1.640028', 'mp4a.40.2'), True),
+    ('mp4', ('vp9',), False),
+    ('mp4', ('vp09.00.50.08',), False),
+    ('mp4', ('avc1.640028', 'opus'), False),
+    ('webm', ('vp9', 'opus'), True),
+    ('webm', ('avc1.640028',), False),
+    ('mkv', ('vp9', 'mp4a.40.2'), True),
+    ('mp4', (None,), None),
+    ('mp4', ('avc1.640028', 'none'), True),
+])
+def test_copyable(container, codecs, expected):
+    assert copyable(container, *codecs) is expected
+
+
+class RecordingYDL:
+    """A YoutubeDL that records the format specs it builds selectors for."""
+
+    def __init__(self):
+        self.ydl = yt_dlp.YoutubeDL({'quiet': True})
+        self.params = self.ydl.params
+        self.specs = []
+
+    def build_format_selector(self, spec):
+        self.specs.append(spec)
+        return self.ydl.build_format_selector(spec)
+
+
+def select(planner, formats):
+    planner.ydl = RecordingYDL()
+    ctx = {'formats': formats, 'has_merged_format': False, 'incomplete_formats': False}
+    return planner.ydl, list(planner(ctx))
+
+
+def test_planner_merges_through_format_selector(recorded_formats):
+    reports = []
+    ydl, selected = select(FormatPlanner('video', 'mp4', max_height=1080, on_plan=reports.append),
+                           recorded_formats['youtube'])
+    assert ydl.specs == ['bv*+ba']
+    assert [f['format_id'] for f in selected] == ['299+140']
+    assert ydl.params['merge_output_format'] == 'mp4'
+    assert reports == [{'kind': REMUX, 'format_id': '299+140', 'steps': ['merge'], 'cpu_seconds': 1.5}]
+
+
+def test_planner_yields_single_format(recorded_formats):
+    planner = FormatPlanner('audio', 'm4a', audio_bitrate=128)
+    ydl, selected = select(planner, recorded_formats['youtube'])
+    assert ydl.specs == []
+    assert [f['format_id'] for f in selected] == ['140']
+    assert planner.report()['kind'] == DIRECT
+    assert planner.postprocess_opts() == {'postprocessors': []}
+
+
+def test_planner_falls_back_to_format_spec():
+    formats = [{'format_id': 'a', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'url': 'http://x/a'}]
+    planner = FormatPlanner('video', 'mp4', fallback='bestaudio/best')
+    ydl, selected = select(planner, formats)
+    assert ydl.specs == ['bestaudio/best']
+    assert [f['format_id'] for f in selected] == ['a']
+    assert planner.plan is None
+    assert planner.report() is None
+    assert planner.postprocess_opts() is None
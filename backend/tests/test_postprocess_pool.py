@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+from yt_dlp.postprocessor import FFmpegExtractAudioPP, FFmpegFixupM3u8PP, FFmpegMergerPP
+
+import postprocess_worker
+from postprocess_pool import HandoffYoutubeDL
+
+
+def test_handoff_records_postprocessor_key_and_kwargs():
+    ydl = HandoffYoutubeDL({'quiet': True, 'postprocessors': [
+        {'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192', 'when': 'post_process'}]},
+        auto_init=False)
+    pps = [FFmpegMergerPP(ydl), FFmpegFixupM3u8PP(ydl), FFmpegExtractAudioPP(ydl, preferredcodec='mp3')]
+    ydl.post_process('media.mp4', {'id': 'x', '__postprocessors': pps})
+    assert ydl.handoffs[0]['postprocessors'] == [
+        {'key': 'FFmpegMerger'},
+        {'key': 'FFmpegFixupM3u8'},
+        {'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'},
+    ]
+
+
+def test_worker_module_does_not_import_the_server():
+    code = 'import sys, postprocess_worker; print("app" in sys.modules or "flask" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(postprocess_worker.__file__),
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
@@ -0,0 +1,27 @@
+import json
+
+from progress_bus import ProgressBus
+from task_store import SQLiteTaskStore
+
+
+def test_processes_number_snapshots_alike(tmp_path):
+    path = str(tmp_path / 'tasks.db')
+    first, second = SQLiteTaskStore(path), SQLiteTaskStore(path)
+    created = first.create('t', {'status': 'queued'})
+    updated, _ = second.update('t', {'status': 'downloading'})
+    assert updated['seq'] > created['seq']
+    assert first.get('t')['seq'] == updated['seq']
+
+    # A view written back is stored without its sequence number
+    copy = second.create('u', first.get('t'))
+    assert copy['seq'] > updated['seq']
+    assert 'seq' not in json.loads(second._conn().execute("SELECT data FROM tasks WHERE task_id = 'u'").fetchone()[0])
+
+
+def test_bus_keeps_the_newest_numbered_snapshot():
+    bus = ProgressBus()
+    assert bus.publish('t', '{"n": 2}', 'downloading', event_id=7) == 7
+    # An older snapshot published late does not replace the newer one
+    assert bus.publish('t', '{"n": 1}', 'queued', event_id=5) == 7
+    assert bus.latest('t') == (7, '{"n": 2}', 'downloading')
+    assert bus.wait('t', last_event_id=5, timeout=0)[0] == 7
@@ -0,0 +1,12 @@
+import yt_dlp
+
+from ydl_pool import YoutubeDLPool
+
+
+def test_create_registers_the_stock_extractor_list():
+    pool = YoutubeDLPool({'analyze': {'quiet': True}})
+    pool.warm_up()
+    ydl = pool.create('analyze')
+    with yt_dlp.YoutubeDL({'quiet': True}) as stock:
+        assert list(ydl._ies) == list(stock._ies)
+        assert list(ydl._ies_instances) == list(stock._ies_instances)
@@ -0,0 +1,266 @@
+import collections
+import logging
+import threading
+
+# Weight of the newest sample in the per-host moving averages
+EWMA_ALPHA = 0.3
+# A fragmented download whose per-connection speed fell below this share of the
+# host's average gained nothing from its extra connections
+SATURATION = 0.6
+# Bandwidth a task is granted beyond its host's average speed
+HEADROOM = 1.25
+
+
+def fair_shares(demands, total):
+    """Max-min fair split of total: no share exceeds its demand, and what a
+    small demand leaves unused goes to the others.
+
+    Args:
+        demands: Key -> wanted amount (None for no limit)
+        total: Amount to divide
+
+    Returns:
+        dict: Key -> share
+    """
+    shares = {}
+    remaining = total
+    pending = sorted(demands, key=lambda key: float('inf') if demands[key] is None else demands[key])
+    while pending:
+        fair = remaining / len(pending)
+        key = pending.pop(0)
+        demand = demands[key]
+        shares[key] = fair if demand is None else min(demand, fair)
+        remaining -= shares[key]
+    return shares
+
+
+class TransferBudget:
+    """Host-wide budget of fragment connections and bandwidth shared by the
+    running downloads.
+
+    Every running download holds a share of max_connections (its
+    concurrent_fragment_downloads) and of max_bandwidth (a rate it is paced
+    to), divided max-min fairly and divided again whenever a download starts
+    or ends. A download whose host is known to be slow or to need few
+    connections asks for less, and what it leaves goes to the others.
+
+    Limits are learned per host (the extractor, or the CDN host of plain
+    URLs) from finished transfers: the connection limit grows by one while
+    a fragmented download used all of it and its per-connection speed held,
+    shrinks by one when that speed collapsed, and halves on a transport
+    error; the HTTP chunk size follows the host's speed so that one chunk
+    takes about chunk_seconds, and is halved by errors as well.
+
+    Only a fragmented (HLS/DASH) download asks for more than one connection;
+    until its first progress report says which kind it is (see
+    set_fragmented()), a download asks for its host's limit.
+
+    New shares reach a running download through its YoutubeDL params: the
+    connection count applies from the next format it starts, and the rate
+    becomes yt-dlp's 'ratelimit'. A plain HTTP download reads that at once;
+    a fragmented one copies it into every fragment connection when a format
+    starts, so it gets its rate divided by its connections.
+    """
+
+    def __init__(self, max_connections=48, max_bandwidth=0, max_per_task=8, chunk_size=5 * 1024 * 1024,
+                 min_chunk_size=1024 * 1024, max_chunk_size=10 * 1024 * 1024, chunk_seconds=2, max_hosts=1000,
+                 on_change=None):
+        """
+        Args:
+            max_connections: Fragment connections open at once across all downloads
+            max_bandwidth: Bytes per second across all downloads (0 for no limit)
+            max_per_task: Fragment connections a single download may open
+            chunk_size: HTTP chunk size for hosts without samples yet
+            min_chunk_size: Smallest HTTP chunk size a host is given
+            max_chunk_size: Largest HTTP chunk size a host is given
+            chunk_seconds: Seconds one HTTP chunk should take at the host's speed
+            max_hosts: Hosts remembered at most (least recently used dropped first)
+            on_change: Called with (task_id, settings) when a download's
+                effective settings change, outside the lock
+        """
+        self.max_connections = max_connections
+        self.max_bandwidth = max_bandwidth
+        self.max_per_task = max_per_task
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.chunk_seconds = chunk_seconds
+        self.max_hosts = max_hosts
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._hosts = collections.OrderedDict()
+
+    def _host(self, key):
+        """Caller holds the lock."""
+        host = self._hosts.get(key)
+        if host is None:
+            host = self._hosts[key] = {'connections': self.max_per_task, 'chunk_size': self.chunk_size,
+                                       'throughput': None, 'per_connection': None, 'error_rate': 0.0,
+                                       'transfers': 0}
+            if len(self._hosts) > self.max_hosts:
+                active = {task['host'] for task in self._tasks.values()}
+                for stale in [name for name in self._hosts if name not in active][:len(self._hosts) - self.max_hosts]:
+                    del self._hosts[stale]
+        self._hosts.move_to_end(key)
+        return host
+
+    def acquire(self, task_id, host):
+        """Give a starting download its share of the budget.
+
+        Args:
+            task_id: The download task
+            host: Extractor or CDN host the download fetches from
+
+        Returns:
+            dict: Effective settings (see settings())
+        """
+        with self._lock:
+            self._tasks[task_id] = {'host': host, 'connections': 1, 'rate': None, 'params': None,
+                                    'fragmented': None}
+            self._host(host)
+            changed = self._rebalance()
+        self._notify(changed)
+        return self.settings(task_id)
+
+    def bind(self, task_id, params):
+        """Apply a download's settings to the params of its YoutubeDL, and keep
+        them there when its share changes."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return
+            task['params'] = params
+            self._apply(task)
+
+    def set_fragmented(self, task_id, fragmented):
+        """Record whether a download's current format is fragmented; a plain
+        HTTP download asks for a single connection."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task['fragmented'] == fragmented:
+                return
+            task['fragmented'] = fragmented
+            self._apply(task)
+            changed = self._rebalance()
+        self._notify(changed)
+
+    def release(self, task_id, transferred=0, seconds=None, fragmented=False, failed=False):
+        """Return a download's share and learn from its transfer.
+
+        Args:
+            transferred: Media bytes received
+            seconds: Time the transfer of those bytes took
+            fragmented: True for fragmented (HLS/DASH) downloads
+            failed: True when the transfer failed on the network side
+        """
+        with self._lock:
+            task = self._tasks.pop(task_id, None)
+            if task is None:
+                return
+            self._learn(self._host(task['host']), task['connections'], transferred, seconds, fragmented, failed)
+            changed = self._rebalance()
+        self._notify(changed)
+
+    def _learn(self, host, connections, transferred, seconds, fragmented, failed):
+        """Caller holds the lock."""
+        if failed:
+            host['error_rate'] += EWMA_ALPHA * (1 - host['error_rate'])
+            host['connections'] = max(1, host['connections'] // 2)
+            host['chunk_size'] = max(self.min_chunk_size, host['chunk_size'] // 2)
+            return
+        if not transferred or not seconds:
+            return
+        host['transfers'] += 1
+        host['error_rate'] -= EWMA_ALPHA * host['error_rate']
+        throughput = transferred / seconds
+        host['throughput'] = throughput if host['throughput'] is None else (
+            host['throughput'] + EWMA_ALPHA * (throughput - host['throughput']))
+        if fragmented:
+            per_connection = throughput / connections
+            if host['per_connection'] is not None and per_connection < host['per_connection'] * SATURATION:
+                host['connections'] = max(1, host['connections'] - 1)
+            elif connections >= host['connections']:
+                host['connections'] = min(self.max_per_task, host['connections'] + 1)
+            host['per_connection'] = per_connection if host['per_connection'] is None else (
+                host['per_connection'] + EWMA_ALPHA * (per_connection - host['per_connection']))
+        else:
+            chunk_size = host['throughput'] * self.chunk_seconds
+            host['chunk_size'] = int(min(self.max_chunk_size, max(self.min_chunk_size, chunk_size)))
+
+    def _rebalance(self):
+        """Divide the budget over the running downloads. Caller holds the lock.
+
+        Returns:
+            list: (task_id, settings) of the downloads whose share changed
+        """
+        if not self._tasks:
+            return []
+        connections = fair_shares({
+            task_id: 1 if task['fragmented'] is False else self._hosts[task['host']]['connections']
+            for task_id, task in self._tasks.items()}, self.max_connections)
+        rates = {}
+        if self.max_bandwidth:
+            rates = fair_shares({task_id: (self._hosts[task['host']]['throughput'] or 0) * HEADROOM or None
+                                 for task_id, task in self._tasks.items()}, self.max_bandwidth)
+        changed = []
+        for task_id, task in self._tasks.items():
+            share = max(1, int(connections[task_id]))
+            rate = int(rates[task_id]) if task_id in rates else None
+            if (share, rate) != (task['connections'], task['rate']):
+                task['connections'], task['rate'] = share, rate
+                self._apply(task)
+                changed.append((task_id, self._settings(task)))
+        return changed
+
+    def _apply(self, task):
+        """Caller holds the lock."""
+        if task['params'] is not None:
+            task['params']['concurrent_fragment_downloads'] = task['connections']
+            task['params']['http_chunk_size'] = self._hosts[task['host']]['chunk_size']
+            rate = task['rate']
+            if rate is not None and task['fragmented'] is not False:
+                rate = max(1, rate // task['connections'])
+            task['params']['ratelimit'] = rate
+
+    def _settings(self, task):
+        """Caller holds the lock."""
+        return {
+            'host': task['host'],
+            'connections': task['connections'],
+            'chunk_size': self._hosts[task['host']]['chunk_size'],
+            'rate_limit': task['rate'],
+        }
+
+    def settings(self, task_id):
+        """A running download's effective settings: host, connections,
+        chunk_size (bytes) and rate_limit (bytes per second, None for no
+        limit); None once it released its share."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return self._settings(task) if task is not None else None
+
+    def _notify(self, changed):
+        if self.on_change is None:
+            return
+        for task_id, settings in changed:
+            try:
+                self.on_change(task_id, settings)
+            except Exception as e:
+                logging.error(f"Transfer budget callback failed for task {task_id}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': len(self._tasks),
+                'connections': sum(task['connections'] for task in self._tasks.values()),
+                'max_connections': self.max_connections,
+                'max_bandwidth_mbps': round(self.max_bandwidth * 8 / 1000000, 1) if self.max_bandwidth else None,
+                'hosts': {key: {
+                    'connections': host['connections'],
+                    'chunk_size': host['chunk_size'],
+                    'throughput_kbps': round(host['throughput'] * 8 / 1000) if host['throughput'] else None,
+                    'error_rate': round(host['error_rate'], 3),
+                    'transfers': host['transfers'],
+                } for key, host in self._hosts.items()},
+            }
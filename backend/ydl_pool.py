@@ -0,0 +1,122 @@
+import copy
+import logging
+import threading
+import time
+
+import yt_dlp
+from yt_dlp.extractor import get_info_extractor
+
+# Probe URL that no site extractor claims; matching it compiles every extractor's URL pattern
+WARMUP_URL = 'http://warmup.invalid/'
+
+
+class YoutubeDLPool:
+    """Builds YoutubeDL instances from pre-configured, pre-warmed profiles.
+
+    A stock YoutubeDL(params) spends most of its construction time ordering
+    the ~1,700 extractor classes (about 80 ms, on every request), and the
+    first URL a process handles compiles every extractor's URL regex and
+    imports the matching extractor module. warm_up() does that work once, in
+    a background thread at startup: it resolves the extractor list, compiles
+    the URL patterns and imports the extractors in warm_extractors.
+
+    create() then builds a fresh instance from the profile's options, with
+    the request's own options (hooks, outtmpl, proxy, format) layered on top,
+    and registers the precomputed extractor list. Every request still gets
+    its own instance, so no per-request state is shared.
+    """
+
+    def __init__(self, profiles, warm_extractors=(), wait_timeout=30):
+        """
+        Args:
+            profiles: Profile name -> base yt-dlp options
+            warm_extractors: Extractor keys whose modules are imported during warm-up
+            wait_timeout: Seconds create() waits for a warm-up in progress
+        """
+        self.profiles = profiles
+        self.warm_extractors = warm_extractors
+        self.wait_timeout = wait_timeout
+        self._extractors = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+        self._warmup_seconds = None
+        self._stock_construct_ms = None
+        self._constructed = 0
+        self._construct_seconds = 0.0
+
+    def start(self):
+        """Warm up in a background thread."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        thread = threading.Thread(target=self.warm_up, name='ydl-warmup')
+        thread.daemon = True
+        thread.start()
+
+    def warm_up(self):
+        started = time.perf_counter()
+        try:
+            # The list add_default_info_extractors builds, taken from a stock instance
+            # rather than rebuilt here, so create() registers exactly the same extractors
+            stock_started = time.perf_counter()
+            with yt_dlp.YoutubeDL({'quiet': True}) as stock:
+                self._stock_construct_ms = round((time.perf_counter() - stock_started) * 1000, 1)
+                extractors = list(stock._ies.values())
+            for ie in extractors:
+                ie.suitable(WARMUP_URL)
+            for ie_key in self.warm_extractors:
+                get_info_extractor(ie_key)()
+            self._extractors = extractors
+        except Exception as e:
+            logging.error(f"yt-dlp warm-up failed, falling back to default construction: {e}")
+        finally:
+            self._warmup_seconds = round(time.perf_counter() - started, 3)
+            self._ready.set()
+        logging.info(f"yt-dlp warm-up done in {self._warmup_seconds}s "
+                     f"({len(self._extractors or ())} extractors; stock construction {self._stock_construct_ms} ms)")
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def create(self, profile, params=None, cls=yt_dlp.YoutubeDL):
+        """Return a new YoutubeDL (or subclass) for one request.
+
+        Args:
+            profile: Name of the base options ('analyze', 'download')
+            params: Request-specific options, applied over the profile's
+            cls: YoutubeDL subclass to instantiate
+        """
+        if not self._ready.is_set():
+            self.start()
+            self._ready.wait(self.wait_timeout)
+        opts = copy.deepcopy(self.profiles[profile])
+        opts.update(params or {})
+        started = time.perf_counter()
+        extractors = self._extractors
+        if extractors is None or 'allowed_extractors' in opts:
+            ydl = cls(opts)
+        else:
+            ydl = cls(opts, auto_init=False)
+            for ie in extractors:
+                # Extractors registered as instances (e.g. UnsupportedURL) are bound to their YoutubeDL
+                ydl.add_info_extractor(ie if isinstance(ie, type) else type(ie)())
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._constructed += 1
+            self._construct_seconds += elapsed
+        return ydl
+
+    def stats(self):
+        with self._lock:
+            constructed, construct_seconds = self._constructed, self._construct_seconds
+        return {
+            'ready': self.ready,
+            'warmup_seconds': self._warmup_seconds,
+            'extractors': len(self._extractors or ()),
+            'constructed': constructed,
+            'avg_construct_ms': round(construct_seconds / constructed * 1000, 2) if constructed else None,
+            'stock_construct_ms': self._stock_construct_ms,
+        }
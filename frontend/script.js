@@ -4,7 +4,8 @@ document.addEventListener('DOMContentLoaded', () => {
         currentTaskId: null,
         currentFormat: 'video',
         mediaInfo: null,
-        eventSource: null
+        eventSource: null,
+        streamStarted: false
     };
 
     // --- CONFIGURATION ---
@@ -274,6 +275,7 @@ const API_BASE_URL = window.location.hostname === 'localhost' || window.location
             quality: state.currentFormat === 'video' ? dom.videoQuality.value : dom.audioQuality.value,
             fps: state.currentFormat === 'video' ? dom.videoFps.value : undefined,
             audio_quality: state.currentFormat === 'audio' ? dom.audioQuality.value : undefined,
+            stream: true,
             useClientIP: true
         };
         setDownloadingState(true);
@@ -293,7 +295,8 @@ const API_BASE_URL = window.location.hostname === 'localhost' || window.location
             if (!response.ok || !data.task_id) throw new Error(data.error || t('failed_to_start_download'));
 
             state.currentTaskId = data.task_id;
-            startProgressMonitor(data.task_id);
+            state.streamStarted = false;
+            startProgressMonitor(data.task_id, data.progress_url);
 
         } catch (error) {
             console.error('Download Start Error:', error);
@@ -303,9 +306,10 @@ const API_BASE_URL = window.location.hostname === 'localhost' || window.location
     }
 
     // --- REAL-TIME: Progress Monitoring via SSE ---
-    function startProgressMonitor(taskId) {
+    function startProgressMonitor(taskId, progressUrl) {
         if (state.eventSource) state.eventSource.close();
-        state.eventSource = new EventSource(`${API_BASE_URL}/stream-progress/${taskId}`);
+        // 서버가 알려준 asyncio SSE 서버 주소 우선, 없으면 API 경로 (프록시가 SSE 포트로 전달)
+        state.eventSource = new EventSource(progressUrl || `${API_BASE_URL}/stream-progress/${taskId}`);
         
         state.eventSource.onmessage = (event) => {
             try {
@@ -315,7 +319,11 @@ const API_BASE_URL = window.location.hostname === 'localhost' || window.location
                 }
                 updateProgress(data.percentage, data.message);
                 if (data.status === 'complete') {
-                   handleDownloadCompletion(taskId);
+                   handleDownloadCompletion(data.download_url);
+                } else if (data.stream_ready && !state.streamStarted) {
+                   // 병합이 필요 없는 포맷: 다운로드 중인 파일을 바로 받기 시작
+                   state.streamStarted = true;
+                   window.location.href = fileUrl(data.download_url);
                 }
             } catch (error) {
                 console.error("SSE Message Error:", error)
@@ -333,9 +341,16 @@ const API_BASE_URL = window.location.hostname === 'localhost' || window.location
     }
     
     // --- FINALIZATION ---
-    function handleDownloadCompletion(taskId) {
+    // download_url은 서버가 서명한 만료 링크 (/api/get-file/<id>?expires=..&sig=..)
+    function fileUrl(downloadUrl) {
+        return new URL(downloadUrl, API_BASE_URL).href;
+    }
+
+    function handleDownloadCompletion(downloadUrl) {
         updateProgress(100, t('download_complete_transferring'));
-        window.location.href = `${API_BASE_URL}/get-file/${taskId}`;
+        if (!state.streamStarted) {
+            window.location.href = fileUrl(downloadUrl);
+        }
         setTimeout(() => setDownloadingState(false), 3000);
         handleDownloadTermination();
     }
@@ -353,7 +368,7 @@ const API_BASE_URL = window.location.hostname === 'localhost' || window.location
             const response = await fetch(`${API_BASE_URL}/check-status/${taskId}`);
             const data = await response.json();
             if (data.status === 'complete') {
-                handleDownloadCompletion(taskId);
+                handleDownloadCompletion(data.download_url);
             } else {
                 showError(data.message || t('could_not_complete_task'));
                 setDownloadingState(false);